@@ -0,0 +1,140 @@
+"""Benchmarks building and solving the crankshaft hypergraph against a local stand-in for the Onshape API.
+
+For each pin count the script reports the graph build time, solve time, number of HTTP calls, bytes moved and
+peak Python memory, along with the number of parts modeled and their mass, and writes the results to a JSON file
+after every case. A case that fails is recorded with its error, and the others still run. Passing a previous
+results file with `--compare` reports any metric that got worse by more than the tolerance, or a model that
+differs or failed, and exits with status 1 if there were any.
+
+    python bench_crankshaft.py --pins 1 4 16 --out bench_results.json
+    python bench_crankshaft.py --pins 1 4 16 --compare bench_results.json
+    python bench_crankshaft.py --pins 1 4 16 --latency 0.05 --solver hypergraph --construction offset
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+from crankshaft_chg import build_crankshaft_graph
+from crankshaftchg_solver import solve
+from onshape_api.standin import StandInServer
+
+PIN_COUNTS = [1, 4, 16, 64, 256]
+COMPARED = ['build_time', 'solve_time', 'http_calls', 'bytes_in', 'bytes_out', 'peak_memory']
+
+def run_case(server: StandInServer, creds: str, num_pins: int, index: int, solver: str='dataflow',
+             construction: str='chained'):
+    """Builds and solves the crankshaft with `num_pins` pins in a fresh part studio of the stand-in, with either
+    the concurrent solver of `crankshaftchg_solver` ('dataflow') or `Hypergraph.solve` ('hypergraph', which
+    exceeds the recursion limit from 64 pins)."""
+    params = dict(num_pins=num_pins, stack=server.url, cred_filepath=creds, construction=construction,
+                  did='benchdoc', wvmid='benchws', eid=f'bench{index}')
+    server.reset_stats()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        chg, handles = build_crankshaft_graph(params)
+        built = time.perf_counter()
+        if solver == 'dataflow':
+            value, solved_values, report = solve(chg, handles['target'])
+            is_solved = value is not None
+        else:
+            # constrainthg 0.1 returns (t, found values), later versions only t
+            t = chg.solve(handles['target'])
+            is_solved = (t[0] if isinstance(t, tuple) else t) is not None
+        solved = time.perf_counter()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    parts = server.mass_properties(params['did'], params['wvmid'], params['eid'])
+    return dict(
+        num_pins = num_pins,
+        build_time = built - start,
+        solve_time = solved - built,
+        http_calls = server.stats['calls'],
+        bytes_in = server.stats['bytes_in'],
+        bytes_out = server.stats['bytes_out'],
+        peak_memory = peak_memory,
+        solved = is_solved,
+        parts = len(parts),
+        mass = sum(body['mass'][0] for body in parts.values()),
+    )
+
+def compare(results: list, baseline: dict, tolerance: float):
+    """Returns a message for every metric more than `tolerance` (fractional) worse than in the baseline, and for
+    every model with a different number of parts or mass."""
+    previous = {r['num_pins']: r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    for result in results:
+        old = previous.get(result['num_pins'])
+        if old is None:
+            continue
+        if 'error' in result:
+            regressions.append(f"{result['num_pins']} pins: failed with {result['error']}")
+            continue
+        # The model itself must not change, whatever the solver or construction
+        if result['parts'] != old.get('parts', result['parts']):
+            regressions.append(f"{result['num_pins']} pins: {old['parts']} parts -> {result['parts']}")
+        if abs(result['mass'] - old.get('mass', result['mass'])) > 1e-9 * old.get('mass', 1.):
+            regressions.append(f"{result['num_pins']} pins: mass {old['mass']:.6g} -> {result['mass']:.6g}")
+        for metric in COMPARED:
+            if old[metric] > 0 and result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{result['num_pins']} pins: {metric} {old[metric]:.4g} -> {result[metric]:.4g}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pins', type=int, nargs='+', default=PIN_COUNTS, help='pin counts to benchmark')
+    parser.add_argument('--latency', type=float, default=0., help='seconds of latency added by the stand-in per request')
+    parser.add_argument('--solver', choices=['dataflow', 'hypergraph'], default='dataflow',
+                        help='run the requests concurrently, or solve with Hypergraph.solve')
+    parser.add_argument('--construction', choices=['chained', 'offset'], default='chained',
+                        help='sketch each section on the previous extrude, or on an offset plane')
+    parser.add_argument('--out', default='bench_results.json', help='file to write the results to')
+    parser.add_argument('--compare', default=None, help='results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='fractional slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    # The results are written after every case, so that a crash keeps the cases that finished
+    results = []
+    out = dict(
+        meta = dict(python=platform.python_version(), platform=platform.platform(),
+                    latency=args.latency, solver=args.solver,
+                    construction=args.construction, time=time.strftime('%Y-%m-%dT%H:%M:%S')),
+        results = results,
+    )
+    with StandInServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        creds = os.path.join(tmp, 'creds.json')
+        server.write_creds(creds)
+        for index, num_pins in enumerate(args.pins):
+            try:
+                result = run_case(server, creds, num_pins, index, args.solver, args.construction)
+            except Exception as e:
+                result = dict(num_pins=num_pins, solved=False, error=f'{type(e).__name__}: {e}')
+                print(f"{num_pins:>5} pins: failed with {result['error']}")
+            else:
+                print(f"{num_pins:>5} pins: build {result['build_time']:.3f} s, solve {result['solve_time']:.3f} s, "
+                      f"{result['http_calls']} calls, {result['bytes_in'] + result['bytes_out']} bytes, "
+                      f"peak {result['peak_memory'] / 1e6:.1f} MB, {result['parts']} parts of {result['mass']:.4g} kg")
+            results.append(result)
+            with open(args.out, 'w') as f:
+                json.dump(out, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
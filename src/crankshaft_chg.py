@@ -3,109 +3,250 @@ import constrainthg.relations as R
 import crankshaftchg_objects as obj
 from crankshaftchg_rels import *
 from onshape_api.library import *
-from onshape_api.client import Client, DocumentIDs
-import onshape_relations as OnShapeR
-
-# NODES
-## Geometery
-center_point_x = Node('center_point_x', 0.)
-center_point_y = Node('center_point_y', 0.)
-shaft_dia = Node('shaft_dia', .025)
-pin_dia = Node('pin_dia', .020)
-web_dia = Node('web_dia', .100)
-bearing_length = Node('bearing_length', 25)
-pin_length = Node('pin_length', 25)
-web_length = Node('web_length', 10)
-shaft_length = Node('shaft_length')
-pin_offset = Node('pin_offset', .030)
-num_pins = Node('number of pins', 4)
-ORIENTATION = [Node(f'pin{i}_orientation', 0.7, description='angle to vertical of crank pin') for i in range(num_pins.static_value)]
-
-## CAD Features
-initial_plane = Node('Initial plane for modeling', 'Front')
-ENTITY_BEARINGS = [obj.CircleEntity(f'Circle-Bearing_start')]
-SKETCH_BEARINGS = [obj.CircleSketch(f'Sketch-Bearing_start')]
-EXTRUDE_BEARINGS = [obj.Cylinder(f'Sketch-Extrude_start', operationType=SMNewBodyOperationType.NEW)]
-ENTITY_WEB1S, ENTITY_PINS, ENTITY_WEB2S = [], [], []
-SKETCH_WEB1S, SKETCH_PINS, SKETCH_WEB2S = [], [], []
-EXTRUDE_WEB1S, EXTRUDE_PINS, EXTRUDE_WEB2S = [], [], []
-
-for NAME in range(1, num_pins.static_value+1):
-    ENTITY_BEARINGS.append(obj.CircleEntity(f'Circle-Bearing{NAME}'))
-    ENTITY_WEB1S.append(obj.CircleEntity(f'Circle-Web{NAME}_1'))
-    ENTITY_PINS.append(obj.CircleEntity(f'Circle-Pin{NAME}'))
-    ENTITY_WEB2S.append(obj.CircleEntity(f'Circle-Web{NAME}_2'))
-    SKETCH_BEARINGS.append(obj.CircleSketch(f'Sketch-Bearing{NAME}'))
-    SKETCH_WEB1S.append(obj.CircleSketch(f'Sketch-Web{NAME}_1'))
-    SKETCH_PINS.append(obj.CircleSketch(f'Sketch-Pin{NAME}'))
-    SKETCH_WEB2S.append(obj.CircleSketch(f'Sketch-Web{NAME}_2'))
-    EXTRUDE_BEARINGS.append(obj.Cylinder(f'Extrude-Bearing{NAME}', operationType=SMNewBodyOperationType.ADD))
-    EXTRUDE_WEB1S.append(obj.Cylinder(f'Extrude-Web{NAME}_1', operationType=SMNewBodyOperationType.ADD))
-    EXTRUDE_PINS.append(obj.Cylinder(f'Extrude-Pin{NAME}', operationType=SMNewBodyOperationType.ADD))
-    EXTRUDE_WEB2S.append(obj.Cylinder(f'Extrude-Web{NAME}_2', operationType=SMNewBodyOperationType.ADD))
-
-ENTITIES = ENTITY_BEARINGS + ENTITY_WEB1S + ENTITY_PINS + ENTITY_WEB2S
-SKETCHES = SKETCH_BEARINGS + SKETCH_WEB1S + SKETCH_PINS + SKETCH_WEB2S
-EXTRUDES = EXTRUDE_BEARINGS + EXTRUDE_WEB1S + EXTRUDE_PINS + EXTRUDE_WEB2S
-SECTIONS = [(ENTITY_BEARINGS[0], SKETCH_BEARINGS[0], EXTRUDE_BEARINGS[0])]
-for i in range(len(ENTITY_PINS)):
-    SECTIONS.append((ENTITY_WEB1S[i], SKETCH_WEB1S[i], EXTRUDE_WEB1S[i]))
-    SECTIONS.append((ENTITY_PINS[i], SKETCH_PINS[i], EXTRUDE_PINS[i]))
-    SECTIONS.append((ENTITY_WEB2S[i], SKETCH_WEB2S[i], EXTRUDE_WEB2S[i]))
-    SECTIONS.append((ENTITY_BEARINGS[i+1], SKETCH_BEARINGS[i+1], EXTRUDE_BEARINGS[i+1]))
-
-## Onshape Connectivity
-cred_filepath = Node('filepath for API credentials', './coding/SECRETS.json') #Change this to cred.json
-client = Node('client for Onshape part studio')
-did = Node('document id for part studio', '99ccbc50135e7bd6a47fc0fb')
-wvm = Node('wvm for part studio', 'w')
-wvmid = Node('workspace version number for part studio', '03b2576bbb9b2c4ef0de9bf4')
-eid = Node('element id for part studio', 'c081126bd4e3181bb497cf01')
-
-chg = Hypergraph()
-chg.add_edge({'cred_path': cred_filepath}, client, lambda cred_path, **kw : Client(creds=cred_path, logging=False))
-
-for entity in ENTITY_BEARINGS:
-    chg.add_edge(shaft_dia, entity.radius, lambda s1, **kw : s1 / 2)
-    chg.add_edge(center_point_x, entity.xCenter, R.Rfirst)
-    chg.add_edge(center_point_y, entity.yCenter, R.Rfirst)
-
-for entity in ENTITY_WEB1S + ENTITY_WEB2S:
-    chg.add_edge(web_dia, entity.radius, lambda s1, **kw : s1 / 2)
-    chg.add_edge(center_point_x, entity.xCenter, R.Rfirst)
-    chg.add_edge(center_point_y, entity.yCenter, R.Rfirst)
-
-for entity, orientation in zip(ENTITY_PINS, ORIENTATION):
-    chg.add_edge(pin_dia, entity.radius, lambda s1, **kw : s1 / 2)
-    chg.add_edge({'angle':orientation, 'offset':pin_offset, 'center_x': center_point_x}, 
-                 entity.xCenter, Rget_pin_center_x)
-    chg.add_edge({'angle':orientation, 'offset':pin_offset, 'center_y': center_point_y}, 
-                 entity.yCenter, Rget_pin_center_y)
-    
-for extrude in EXTRUDE_BEARINGS:
-    chg.add_edge(bearing_length, extrude.depth, R.Rfirst)
-
-for extrude in EXTRUDE_WEB1S + EXTRUDE_WEB2S:
-    chg.add_edge(web_length, extrude.depth, R.Rfirst)
-
-for extrude in EXTRUDE_PINS:
-    chg.add_edge(pin_length, extrude.depth, R.Rfirst)
-
-for entity, sketch, extrude in SECTIONS:
-    chg.add_edge({'radius': entity.radius, 'xCenter': entity.xCenter, 'yCenter':entity.yCenter},
-                entity.call, obj.CircleEntity.Rget_call)
-    if entity is ENTITIES[0]:
-        chg.add_edge({'face_id': initial_plane, 'did': did, 'wid': wvmid, 'eid': eid, 'client': client}, 
-                    sketch.plane_id, Rget_plane_id)
-    else:
-        prev_extrude = SECTIONS[SECTIONS.index((entity, sketch, extrude)) - 1][-1]
-        chg.add_edge({'face_id': prev_extrude.id, 'did': did, 'wid': wvmid, 'eid': eid, 'client': client}, 
-                    sketch.plane_id, Rget_plane_id)
-    chg.add_edge({'name': sketch.name, 'plane_id': sketch.plane_id, 'circle_call': entity.call}, 
-                 sketch.call, obj.CircleSketch.Rget_call)
-    chg.add_edge({'call': sketch.call, 'did': did, 'wid': wvmid, 'eid': eid, 'client': client},
-                 sketch.id, Radd_feature_and_get_id)
-    chg.add_edge({'name': extrude.name, 'feature_id': sketch.id, 'depth': extrude.depth, 'endBound': extrude.endBound, 'operationType': extrude.operationType}, extrude.call, obj.Cylinder.Rget_extrusion_call)
-    chg.add_edge({'call': extrude.call, 'did': did, 'wid': wvmid, 'eid': eid, 'client': client}, extrude.id, Radd_feature_and_get_id)
-    
-t, solved_values = chg.solve(EXTRUDES[-1].id)
\ No newline at end of file
+from onshape_api.ledger import FeatureLedger
+from crankshaftchg_memo import RelationMemo
+
+DEFAULT_PARAMS = dict(
+    center_point_x = 0.,
+    center_point_y = 0.,
+    shaft_dia = .025,
+    pin_dia = .020,
+    web_dia = .100,
+    bearing_length = 25,
+    pin_length = 25,
+    web_length = 10,
+    pin_offset = .030,
+    num_pins = 4,
+    pin_orientations = None,
+    initial_plane = 'Front',
+    stack = 'https://cad.onshape.com',
+    cred_filepath = './coding/SECRETS.json', #Change this to cred.json
+    did = '99ccbc50135e7bd6a47fc0fb',
+    wvm = 'w',
+    wvmid = '03b2576bbb9b2c4ef0de9bf4',
+    eid = 'c081126bd4e3181bb497cf01',
+    ledger_filepath = None, #Set to a file to update the model in place on later runs
+    construction = 'chained', #Or 'offset' to sketch every section on a plane offset from the initial plane
+    memo_dirpath = None, #Set to a folder to reuse the results of unchanged Onshape reads on later runs
+    memo_refresh = False, #Set to drop the results in memo_dirpath, e.g. after editing the document by hand
+    part_ids = ('JHD',), #Parts to find the mass properties of; JHD is the first part made in a part studio
+)
+LEDGER_LABEL = 'ledger of features pushed to the part studio'
+
+def build_crankshaft_graph(params: dict=None, wrap=None):
+    """Builds the constraint hypergraph of a crankshaft with the given parameters (see `DEFAULT_PARAMS`).
+
+    `wrap`, if given, is called as `wrap(rel, label)` for the relation of every edge and the label of its target,
+    and returns the relation to put on the edge in its place (e.g. to profile the relations). With `memo_dirpath`
+    set, the relations are first wrapped by a `RelationMemo` stored in that folder, keyed on the ledger if there is
+    one.
+
+    Building takes time linear in the number of pins and makes no requests; the Onshape client is only created
+    when the graph is solved. Returns the hypergraph and a dictionary of handles to its nodes:
+
+    - target : the node for the id of the final extrude, to solve for (with the 'offset' construction, only
+      found once every section is modeled)
+    - inputs : the node of each parameter, keyed as in `DEFAULT_PARAMS`
+    - orientations : the orientation node of each pin
+    - sections : (entity, sketch, extrude) of each section, from the start of the shaft
+    - kinds : 'bearing', 'web' or 'pin' for each section
+    - pins : the `CircleEntityGroup` of the pin circles
+    - planes : the `OffsetPlane` of each section after the first, with the 'offset' construction
+    - mass_properties : the node for the `MassPropertiesTable` of the part studio, once it is modeled
+    - parts : the `PartMassProperties` of each of the `part_ids`, filled from the table
+    - client : the node for the Onshape client
+    """
+    params = DEFAULT_PARAMS | (params or {})
+
+    # NODES
+    ## Geometery
+    center_point_x = Node('center_point_x', params['center_point_x'])
+    center_point_y = Node('center_point_y', params['center_point_y'])
+    shaft_dia = Node('shaft_dia', params['shaft_dia'])
+    pin_dia = Node('pin_dia', params['pin_dia'])
+    web_dia = Node('web_dia', params['web_dia'])
+    bearing_length = Node('bearing_length', params['bearing_length'])
+    pin_length = Node('pin_length', params['pin_length'])
+    web_length = Node('web_length', params['web_length'])
+    pin_offset = Node('pin_offset', params['pin_offset'])
+    num_pins = Node('number of pins', params['num_pins'])
+    orientations = params['pin_orientations'] or [0.7] * num_pins.static_value
+    ORIENTATION = [Node(f'pin{i}_orientation', orientations[i], description='angle to vertical of crank pin') for i in range(num_pins.static_value)]
+
+    ## CAD Features
+    # Sections run bearing, web, pin, web, bearing, ... along the shaft
+    initial_plane = Node('Initial plane for modeling', params['initial_plane'])
+    SECTIONS = [(obj.CircleEntity('Circle-Bearing_start'), obj.CircleSketch('Sketch-Bearing_start'),
+                 obj.Cylinder('Sketch-Extrude_start', operationType=SMNewBodyOperationType.NEW))]
+    KINDS = ['bearing']
+    for NAME in range(1, num_pins.static_value+1):
+        for part, kind in ((f'Web{NAME}_1', 'web'), (f'Pin{NAME}', 'pin'), (f'Web{NAME}_2', 'web'), (f'Bearing{NAME}', 'bearing')):
+            SECTIONS.append((obj.CircleEntity(f'Circle-{part}'), obj.CircleSketch(f'Sketch-{part}'),
+                             obj.Cylinder(f'Extrude-{part}', operationType=SMNewBodyOperationType.ADD)))
+            KINDS.append(kind)
+
+    ## Onshape Connectivity
+    stack = Node('base URL of the Onshape stack', params['stack'])
+    cred_filepath = Node('filepath for API credentials', params['cred_filepath'])
+    client = Node('client for Onshape part studio')
+    did = Node('document id for part studio', params['did'])
+    wvm = Node('wvm for part studio', params['wvm'])
+    wvmid = Node('workspace version number for part studio', params['wvmid'])
+    eid = Node('element id for part studio', params['eid'])
+
+    ## Incremental updates
+    # With a ledger, features that did not change since the last run are not sent, and changed features are
+    # updated in place rather than added again.
+    push_inputs = {'did': did, 'wid': wvmid, 'eid': eid, 'client': client}
+    Rpush_feature = Radd_feature_and_get_id
+    ledger = None
+    if params['ledger_filepath'] is not None:
+        ledger = FeatureLedger(params['ledger_filepath'])
+        push_inputs['ledger'] = Node(LEDGER_LABEL, ledger)
+        Rpush_feature = Rupsert_feature_and_get_id
+
+    # EDGES
+    # Each edge is labeled by its target, which is unique, so the hypergraph does not probe for a free label.
+    # Nodes already in the hypergraph are passed by label, as inserting a node again merges it with itself,
+    # copying its sets of edges (which for shared nodes like `client` grow with the number of sections).
+    wrappers = []
+    if params['memo_dirpath'] is not None:
+        memo = RelationMemo(params['memo_dirpath'], ledger=ledger)
+        if params['memo_refresh']:
+            memo.clear()
+        wrappers.append(memo.wrap)
+    if wrap is not None:
+        wrappers.append(wrap)
+
+    chg = Hypergraph()
+    def ref(node: Node):
+        return node.label if node.label in chg.nodes else node
+
+    def add_edge(sources, target: Node, rel):
+        if isinstance(sources, dict):
+            sources = {key: ref(node) for key, node in sources.items()}
+        else:
+            sources = ref(sources)
+        for wrapper in wrappers:
+            rel = wrapper(rel, target.label)
+        chg.add_edge(sources, ref(target), rel, label=target.label)
+
+    add_edge({'cred_path': cred_filepath, 'stack': stack}, client, Rmake_client)
+
+    # The pin circles are solved together: one edge for all the centers and one for all the circles
+    PINS = obj.CircleEntityGroup('Circle-Pins', [entity for (entity, sketch, extrude), kind in zip(SECTIONS, KINDS) if kind == 'pin'])
+    add_edge(pin_dia, PINS.radius, Rhalf)
+    add_edge({f'angle{i}': orientation for i, orientation in enumerate(ORIENTATION)} 
+             | {'offset': pin_offset, 'center_x': center_point_x, 'center_y': center_point_y}, 
+             PINS.centers, Rget_pin_centers)
+    add_edge({'radius': PINS.radius, 'centers': PINS.centers}, PINS.calls, obj.CircleEntityGroup.Rget_calls)
+    for entity, index in zip(PINS.members, PINS.indices):
+        add_edge({'values': PINS.calls, 'index': index}, entity.call, obj.CircleEntityGroup.Rget_member)
+
+    # With the 'chained' construction each sketch is on the end face of the previous extrude, so the sections
+    # are pushed one after the other. With the 'offset' construction each sketch after the first is on a plane
+    # offset from the initial plane by the lengths of the sections before it, computed locally, so that the
+    # sections do not wait on each other.
+    if params['construction'] not in ('chained', 'offset'):
+        raise ValueError(f"construction must be 'chained' or 'offset', not {params['construction']!r}")
+    PLANES = []
+    if params['construction'] == 'offset':
+        PLANES = [obj.OffsetPlane(f'Plane-{sketch.label[len("Sketch-"):]}') for entity, sketch, extrude in SECTIONS[1:]]
+        offset_source = Node('offset of the start of the shaft', 0)
+        for (entity, sketch, extrude), plane in zip(SECTIONS, PLANES):
+            add_edge({'s1': offset_source, 's2': extrude.depth}, plane.offset, R.Rsum)
+            add_edge({'name': plane.name, 'base_plane_id': SECTIONS[0][1].plane_id, 'offset': plane.offset},
+                     plane.call, obj.OffsetPlane.Rget_call)
+            add_edge({'call': plane.call} | push_inputs, plane.id, Rpush_feature)
+            offset_source = plane.offset
+
+    diameters = {'bearing': shaft_dia, 'web': web_dia}
+    lengths = {'bearing': bearing_length, 'web': web_length, 'pin': pin_length}
+    plane_source = initial_plane
+    for i, ((entity, sketch, extrude), kind) in enumerate(zip(SECTIONS, KINDS)):
+        if kind != 'pin':
+            add_edge(diameters[kind], entity.radius, Rhalf)
+            add_edge(center_point_x, entity.xCenter, R.Rfirst)
+            add_edge(center_point_y, entity.yCenter, R.Rfirst)
+            add_edge({'radius': entity.radius, 'xCenter': entity.xCenter, 'yCenter':entity.yCenter},
+                     entity.call, obj.CircleEntity.Rget_call)
+        add_edge(lengths[kind], extrude.depth, R.Rfirst)
+
+        if i > 0 and PLANES:
+            add_edge({'name': sketch.name, 'plane_feature_id': PLANES[i-1].id, 'circle_call': entity.call},
+                     sketch.call, obj.CircleSketch.Rget_call_on_plane)
+        else:
+            add_edge({'face_id': plane_source, 'did': did, 'wid': wvmid, 'eid': eid, 'client': client}, 
+                     sketch.plane_id, Rget_plane_id)
+            add_edge({'name': sketch.name, 'plane_id': sketch.plane_id, 'circle_call': entity.call}, 
+                     sketch.call, obj.CircleSketch.Rget_call)
+        add_edge({'call': sketch.call} | push_inputs, sketch.id, Rpush_feature)
+        extrude_inputs = {'name': extrude.name, 'feature_id': sketch.id, 'depth': extrude.depth, 'endBound': extrude.endBound, 'operationType': extrude.operationType}
+        if i > 0 and PLANES:
+            # An ADD extrude only joins the parts made before it, so each waits for the NEW extrude of the shaft
+            extrude_inputs['after_id'] = SECTIONS[0][2].id
+        add_edge(extrude_inputs, extrude.call, obj.Cylinder.Rget_extrusion_call)
+        add_edge({'call': extrude.call} | push_inputs, extrude.id, Rpush_feature)
+        plane_source = extrude.id
+
+    # Without the chain the last extrude no longer depends on the others, so the target waits on all of them
+    target = SECTIONS[-1][2].id
+    if PLANES:
+        target = Node('ID for the last extrude, once all sections are modeled')
+        add_edge({f'id{i}': extrude.id for i, (entity, sketch, extrude) in enumerate(SECTIONS)}, target, Rget_last_id)
+
+    # The mass properties of every part are read in one request, once the last feature is pushed
+    MASS_PROPERTIES = Node('mass properties of the parts in the part studio')
+    add_edge({'modeled': target, 'did': did, 'wid': wvmid, 'eid': eid, 'client': client}, MASS_PROPERTIES,
+             Rget_mass_properties_table)
+    PARTS = [obj.PartMassProperties(f'Part {part_id}', part_id=part_id) for part_id in params['part_ids']]
+    for part in PARTS:
+        for node, rel in ((part.mass, obj.PartMassProperties.Rget_mass),
+                          (part.centroid, obj.PartMassProperties.Rget_centroid),
+                          (part.inertia, obj.PartMassProperties.Rget_inertia),
+                          (part.principal_inertia, obj.PartMassProperties.Rget_principal_inertia),
+                          (part.principal_axes, obj.PartMassProperties.Rget_principal_axes)):
+            add_edge({'table': MASS_PROPERTIES, 'part_id': part.part_id}, node, rel)
+
+    handles = dict(
+        target = target,
+        inputs = dict(center_point_x=center_point_x, center_point_y=center_point_y, shaft_dia=shaft_dia, 
+                      pin_dia=pin_dia, web_dia=web_dia, bearing_length=bearing_length, pin_length=pin_length,
+                      web_length=web_length, pin_offset=pin_offset, num_pins=num_pins, 
+                      initial_plane=initial_plane, stack=stack, cred_filepath=cred_filepath, did=did, wvm=wvm,
+                      wvmid=wvmid, eid=eid),
+        orientations = ORIENTATION,
+        sections = SECTIONS,
+        kinds = KINDS,
+        pins = PINS,
+        planes = PLANES,
+        mass_properties = MASS_PROPERTIES,
+        parts = PARTS,
+        client = client,
+    )
+    return chg, handles
+
+def delete_stale_features(ledger: FeatureLedger, client: 'Client', did: str, wid: str, eid: str):
+    """Deletes the features pushed in an earlier run that are no longer part of the model (e.g. after reducing
+    the number of pins), returning their names."""
+    stale = ledger.stale(did, wid, eid)
+    for name, feature_id in stale.items():
+        client.delete_feature(did, wid, eid, feature_id)
+        ledger.forget(did, wid, eid, name)
+    ledger.compact()
+    return list(stale)
+
+if __name__ == '__main__':
+    import argparse
+    from onshape_api.client import Client
+    parser = argparse.ArgumentParser(description='Models the crankshaft with the default parameters in Onshape.')
+    parser.add_argument('--ledger', default=None,
+                        help='ledger file to update the model in place, deleting the features no longer in it')
+    args = parser.parse_args()
+
+    p = DEFAULT_PARAMS | dict(ledger_filepath=args.ledger)
+    chg, handles = build_crankshaft_graph(p)
+    t, solved_values = chg.solve(handles['target'])
+    if t is not None and args.ledger is not None:
+        with Client(stack=p['stack'], creds=p['cred_filepath']) as client:
+            delete_stale_features(chg.get_node(LEDGER_LABEL).static_value, client, p['did'], p['wvmid'], p['eid'])
@@ -0,0 +1,256 @@
+"""Parametric sweeps of the crankshaft hypergraph.
+
+A sweep takes a grid or a random sample over the source nodes of `crankshaft_chg` (see `SWEEPABLE`, plus
+`pin{i}_orientation` for each pin), and builds and solves one hypergraph per design point across a pool of
+processes. Each point is modeled in a new part studio of the document, so points never share features.
+
+The number of points in flight per credentials file is bounded, so that adding workers does not exceed the
+rate limit of a single API key; pass several credentials files to spread the points over them. Every finished
+point is appended to a checkpoint file, and rerunning a sweep with the same checkpoint skips the points that
+already succeeded with the same model parameters; the stack and credentials files are not part of that, so a
+sweep can be resumed with other keys or against a new stand-in server. Each point is solved with the dataflow
+solver for the mass and principal moments of inertia of the parts in `part_ids`, which are collected with the
+id of the last extrude and the timings into a columnar table (a dict of lists) and written to CSV.
+
+    python crankshaft_sweep.py --grid pin_dia=.018,.020,.022 --grid web_dia=.090,.100 --out sweep.csv
+    python crankshaft_sweep.py --random pin_offset=.025:.035 --samples 50 --checkpoint sweep.jsonl
+"""
+import os
+import csv
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from crankshaft_chg import DEFAULT_PARAMS, build_crankshaft_graph
+from crankshaftchg_solver import solve
+from onshape_api.client import Client
+
+SWEEPABLE = ['center_point_x', 'center_point_y', 'shaft_dia', 'pin_dia', 'web_dia', 'bearing_length',
+             'pin_length', 'web_length', 'pin_offset', 'num_pins']
+# Parameters that say where and how a point is modeled, but not what is modeled, so are left out of `point_key`
+UNKEYED = ['stack', 'cred_filepath']
+
+def grid(space: dict):
+    """Returns every combination of the values in `space`, a dictionary of lists keyed by parameter name."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+def random_sample(space: dict, samples: int, seed: int=None):
+    """Returns `samples` points drawn uniformly from `space`, a dictionary of (low, high) bounds keyed by
+    parameter name."""
+    rng = random.Random(seed)
+    return [{name: rng.uniform(*space[name]) for name in space} for i in range(samples)]
+
+def point_key(point: dict, base: dict=None):
+    """Identifies a design point independently of its position in the sweep, together with the parameters it
+    is merged into (other than those in `UNKEYED`), so that a checkpoint is not resumed with another model."""
+    keyed = dict(point=point, base={name: value for name, value in (base or {}).items() if name not in UNKEYED})
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+def design_params(point: dict, base: dict):
+    """Merges a design point into the parameters of `build_crankshaft_graph`, collecting the
+    `pin{i}_orientation` values into `pin_orientations`."""
+    params = base.copy()
+    orientations = {}
+    for name, value in point.items():
+        if name.startswith('pin') and name.endswith('_orientation'):
+            orientations[int(name[3:-len('_orientation')])] = value
+        elif name in SWEEPABLE:
+            params[name] = value
+        else:
+            raise KeyError(f'{name} is not a parameter of the crankshaft')
+    params['num_pins'] = int(params['num_pins'])
+    if orientations:
+        pin_orientations = list(params['pin_orientations'] or [0.7] * params['num_pins'])
+        for i, value in orientations.items():
+            pin_orientations[i] = value
+        params['pin_orientations'] = pin_orientations
+    return params
+
+def run_point(index: int, point: dict, base: dict, new_studio: bool=True, key: str=None):
+    """Builds and solves the crankshaft for one design point, returning a row of the results table (identified
+    by `key`, else by `point_key` of the point and `base`) with the mass and principal moments of inertia of each
+    part. Errors are recorded in the row rather than raised, so that one failed point does not end the sweep."""
+    row = dict(index=index, key=key or point_key(point, base), **point, eid=None, feature_id=None,
+               build_time=None, solve_time=None, error=None)
+    try:
+        params = design_params(point, base)
+        if new_studio:
+            with Client(stack=params['stack'], creds=params['cred_filepath']) as client:
+                response = client.create_partstudio(params['did'], params['wvmid'], f'Sweep {index}')
+                response.raise_for_status()
+                params['eid'] = response.json()['id']
+        row['eid'] = params['eid']
+
+        start = time.perf_counter()
+        chg, handles = build_crankshaft_graph(params)
+        built = time.perf_counter()
+        table, values, report = solve(chg, handles['mass_properties'])
+        for part in handles['parts']:
+            part_id = part.part_id.static_value
+            mass, values, report = solve(chg, part.mass, values)
+            principal_inertia, values, report = solve(chg, part.principal_inertia, values)
+            row[f'{part_id}_mass'] = mass
+            for i, moment in enumerate(principal_inertia, 1):
+                row[f'{part_id}_principal_inertia_{i}'] = float(moment)
+        row['build_time'] = built - start
+        row['solve_time'] = time.perf_counter() - built
+        row['feature_id'] = values[handles['target'].label]
+    except Exception as e:
+        row['error'] = repr(e)
+    return row
+
+def load_checkpoint(file_path: str):
+    """Returns the rows of the points that succeeded in an earlier run, keyed by `point_key`."""
+    done = {}
+    if file_path is None or not os.path.isfile(file_path):
+        return done
+    with open(file_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if row['error'] is None:
+                done[row['key']] = row
+    return done
+
+def to_columns(rows: list):
+    """Converts a list of rows into a columnar table, a dict of equal-length lists."""
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    return {name: [row.get(name) for row in rows] for name in names}
+
+def write_csv(columns: dict, file_path: str):
+    """Writes a columnar table to a CSV file."""
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*columns.values()))
+
+def run_sweep(points: list, base: dict=None, creds: list=None, max_workers: int=4, per_credential: int=2,
+              checkpoint: str=None, new_studio: bool=True, to_print: bool=False):
+    """Builds and solves the crankshaft for every design point across a process pool.
+
+    Parameters
+    ----------
+    points : list[dict]
+        Design points, each a dictionary of parameter values (see `grid` and `random_sample`).
+    base : dict, optional
+        Parameters shared by every point, overriding `DEFAULT_PARAMS`.
+    creds : list[str], optional
+        Credentials files to spread the points over; the `cred_filepath` of `base` if not given.
+    max_workers : int, default=4
+        Number of worker processes.
+    per_credential : int, default=2
+        Maximum number of points in flight for each credentials file.
+    checkpoint : str, optional
+        JSON lines file that finished points are appended to, and that successful points are skipped from.
+    new_studio : bool, default=True
+        Models each point in a new part studio of the document, rather than in the element of `base`.
+
+    Returns
+    -------
+    dict
+        Columnar results table, one row per point in the order of `points`.
+    """
+    base = DEFAULT_PARAMS | (base or {})
+    creds = creds or [base['cred_filepath']]
+    done = load_checkpoint(checkpoint)
+    rows = {}
+    pending = deque()
+    for index, point in enumerate(points):
+        key = point_key(point, base)
+        if key in done:
+            rows[index] = done[key] | {'index': index}
+        else:
+            pending.append((index, point, key))
+
+    in_flight = {cred: 0 for cred in creds}
+    futures = {}
+    log = open(checkpoint, 'a') if checkpoint is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            while pending or futures:
+                while pending:
+                    cred = min(creds, key=in_flight.get)
+                    if in_flight[cred] >= per_credential:
+                        break
+                    index, point, key = pending.popleft()
+                    futures[pool.submit(run_point, index, point, base | {'cred_filepath': cred}, new_studio, key)] = cred
+                    in_flight[cred] += 1
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    in_flight[futures.pop(future)] -= 1
+                    row = future.result()
+                    rows[row['index']] = row
+                    if log is not None:
+                        log.write(json.dumps(row) + '\n')
+                        log.flush()
+                    if to_print:
+                        status = row['error'] or f"{row['solve_time']:.2f} s"
+                        print(f"point {row['index']:>5} ({len(rows)}/{len(points)}): {status}")
+    finally:
+        if log is not None:
+            log.close()
+
+    return to_columns([rows[index] for index in sorted(rows)])
+
+def parse_space(specs: list, parse):
+    """Parses `name=...` command line specifications into a dictionary."""
+    space = {}
+    for spec in specs:
+        name, values = spec.split('=', 1)
+        space[name] = parse(values)
+    return space
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help='values of a parameter to take every combination of')
+    parser.add_argument('--random', action='append', default=[], metavar='NAME=LOW:HIGH',
+                        help='bounds of a parameter to sample uniformly')
+    parser.add_argument('--samples', type=int, default=10, help='number of random points')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random points')
+    parser.add_argument('--creds', nargs='+', default=None, help='credentials files to spread the points over')
+    parser.add_argument('--workers', type=int, default=4, help='number of worker processes')
+    parser.add_argument('--per-credential', type=int, default=2, help='points in flight per credentials file')
+    parser.add_argument('--checkpoint', default=None, help='file to record finished points in and resume from')
+    parser.add_argument('--out', default='sweep.csv', help='CSV file to write the results table to')
+    parser.add_argument('--standin', action='store_true', help='run against a local stand-in for the Onshape API')
+    args = parser.parse_args(argv)
+
+    if args.grid and args.random:
+        parser.error('use either --grid or --random')
+    if args.random:
+        space = parse_space(args.random, lambda values: tuple(float(v) for v in values.split(':')))
+        points = random_sample(space, args.samples, args.seed)
+    else:
+        points = grid(parse_space(args.grid, lambda values: [float(v) for v in values.split(',')]))
+
+    if not args.standin:
+        columns = run_sweep(points, creds=args.creds, max_workers=args.workers, per_credential=args.per_credential,
+                            checkpoint=args.checkpoint, to_print=True)
+    else:
+        import tempfile
+        from onshape_api.standin import StandInServer
+        with StandInServer() as server, tempfile.TemporaryDirectory() as tmp:
+            creds = os.path.join(tmp, 'creds.json')
+            server.write_creds(creds)
+            columns = run_sweep(points, base=dict(stack=server.url), creds=[creds], max_workers=args.workers,
+                                per_credential=args.per_credential, checkpoint=args.checkpoint, to_print=True)
+
+    write_csv(columns, args.out)
+    failed = sum(error is not None for error in columns.get('error', []))
+    print(f'{len(points) - failed} of {len(points)} points solved, results written to {args.out}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Memoizes the results of hypergraph relations on disk, so that later runs skip the Onshape requests whose inputs
+did not change.
+
+A result is stored under a hash of the relation (`module:qualname`) and of its inputs. What a read returns also
+depends on the part studio, which the inputs do not describe, so given the `FeatureLedger` the features were pushed
+through, the key holds the digests of the features read as well (see `READ_RELATIONS`): a read of a feature is
+reused until that feature is pushed with a new definition, and a read of the whole part studio until any of its
+features is. Without a ledger, features are added again on every run, so reads of a feature are keyed on its new
+id; reads of the whole part studio are then not memoized. Edits made to the document outside of the graph are not
+seen: `clear` the memo (the `memo_refresh` parameter) after them. Results are pickled into a size-bounded
+`onshape_api.cache.ResponseCache`, which evicts the least recently used entries once it is full.
+
+Only relations that read are memoized: a relation that adds a feature has to run for the feature to exist. Use a
+`FeatureLedger` (the `ledger_filepath` parameter) to skip pushing unchanged features.
+
+    memo = RelationMemo('.chg_memo', ledger=ledger)
+    chg, handles = build_crankshaft_graph(params, wrap=memo.wrap)
+    t, solved_values = chg.solve(handles['target'])
+    print(f'{memo.hits} hits, {memo.misses} misses')
+"""
+import json
+import pickle
+import inspect
+import hashlib
+import functools
+import threading
+from enum import Enum
+
+from onshape_api.cache import ResponseCache
+from onshape_api.ledger import FeatureLedger
+from crankshaftchg_snapshot import name_of
+from crankshaftchg_rels import Rget_plane_id, Rget_mass, Rget_moment_of_inertia, Rget_mass_properties_table
+
+# Relations that read, with the input holding the ids of the features they read, or None if they read the whole
+# part studio
+READ_RELATIONS = {
+    Rget_plane_id: 'face_id',
+    Rget_mass: None,
+    Rget_moment_of_inertia: None,
+    Rget_mass_properties_table: None,
+}
+
+# Objects that can be inputs, with the attributes that identify them in a key
+IDENTITIES = {
+    'onshape_api.client:Client': ('_stack',),
+    'onshape_api.ledger:FeatureLedger': ('file_path',),
+}
+
+def fingerprint(value):
+    """Converts an input of a relation into JSON values that identify it, raising a TypeError if it cannot be."""
+    if isinstance(value, Enum):
+        return [name_of(type(value)), value.value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [fingerprint(v) for v in value]
+    if isinstance(value, dict):
+        return [[fingerprint(k), fingerprint(v)] for k, v in sorted(value.items(), key=lambda item: repr(item[0]))]
+    name = name_of(type(value))
+    if name in IDENTITIES:
+        return [name] + [getattr(value, attr) for attr in IDENTITIES[name]]
+    if hasattr(value, 'tolist'):
+        return fingerprint(value.tolist())
+    raise TypeError(f'input of type {name} cannot be part of a memo key')
+
+class RelationMemo:
+    """An on-disk memo of relation results, shared between runs.
+
+    Parameters
+    ----------
+    directory : str
+        Folder to keep the results in.
+    max_bytes : int, default=256 MB
+        Largest total size of the stored results.
+    ledger : FeatureLedger, optional
+        Ledger of the features pushed to the part studio, whose digests key the reads.
+    rels : dict, default=READ_RELATIONS
+        Relations to memoize, with the input naming the features they read; `wrap` returns all others unchanged.
+    """
+    def __init__(self, directory: str, max_bytes: int=256 << 20, ledger: FeatureLedger=None,
+                 rels: dict=READ_RELATIONS):
+        self.store = ResponseCache(directory, max_bytes=max_bytes)
+        self.ledger = ledger
+        self.rels = rels
+        self.hits = 0
+        self.misses = 0
+        self._wrapped = {}
+        self._lock = threading.Lock()
+
+    def key(self, rel, kwargs: dict, state=None):
+        """Makes the key of a call to a relation, given the `state` of the features it reads."""
+        text = json.dumps([name_of(rel), fingerprint(kwargs), state], separators=(',', ':'))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def state(self, rel, kwargs: dict):
+        """Returns the digests of the features read by a call, from the ledger. Raises a TypeError if the call
+        cannot be memoized."""
+        features = self.rels[rel]
+        if self.ledger is None:
+            if features is None:
+                raise TypeError(f'{name_of(rel)} reads the whole part studio, so is only memoized with a ledger')
+            return None
+        digests = self.ledger.digests(kwargs['did'], kwargs['wid'], kwargs['eid'])
+        if features is None:
+            return sorted(digests.items())
+        ids = kwargs[features]
+        if isinstance(ids, str):
+            return digests.get(ids)
+        return [digests.get(i) for i in ids]
+
+    def clear(self):
+        """Drops every stored result, e.g. after the document was edited outside of the graph."""
+        self.store.clear()
+
+    def get(self, key: str):
+        """Returns (True, result) if a result is stored under `key`, else (False, None)."""
+        found = self.store.get(key)
+        if found is None:
+            return False, None
+        meta, body_path = found
+        try:
+            with open(body_path, 'rb') as f:
+                return True, pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.store.discard(key)
+            return False, None
+
+    def put(self, key: str, result):
+        """Stores the result of a call."""
+        self.store.put(key, [pickle.dumps(result)], 200, {})
+
+    def call(self, rel, kwargs: dict):
+        """Returns the result of `rel(**kwargs)`, from the store if it was found before."""
+        try:
+            unwrapped = inspect.unwrap(rel)
+            key = self.key(unwrapped, kwargs, self.state(unwrapped, kwargs))
+        except TypeError:
+            return rel(**kwargs)
+        found, result = self.get(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return result
+
+        result = rel(**kwargs)
+        self.put(key, result)
+        return result
+
+    def wrap(self, rel, label: str=None):
+        """Returns the memoized version of a relation, or the relation itself if it is not memoized. Pass as the
+        `wrap` of `build_crankshaft_graph`."""
+        if inspect.unwrap(rel) not in self.rels:
+            return rel
+        if rel not in self._wrapped:
+            @functools.wraps(rel)
+            def memoized(*args, **kwargs):
+                if args:
+                    return rel(*args, **kwargs)
+                return self.call(rel, kwargs)
+            self._wrapped[rel] = memoized
+        return self._wrapped[rel]
@@ -1,76 +1,311 @@
 from constrainthg import Node
 from onshape_api.library import *
-from onshape_api.client import Client, DocumentIDs
+from onshape_api.ledger import feature_digest
+import re
 import json
+from json.encoder import encode_basestring_ascii
+
+class FeatureCall(str):
+    """A JSON-serialized feature definition (or part of one), made by a `FeatureTemplate`. It is sent as is, and
+    inserted verbatim when used as the value of a slot in another template."""
+    __slots__ = ('name', '_digest')
+
+    @property
+    def digest(self):
+        """Content hash of the definition, computed once with `onshape_api.ledger.feature_digest` so that it
+        matches the digests of a ledger written from parsed or dict bodies."""
+        if self._digest is None:
+            self._digest = feature_digest(self)
+        return self._digest
+
+class Slot:
+    """Marks a variable value in the skeleton of a `FeatureTemplate`."""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+def encode_value(value):
+    """Serializes a single slot value to JSON."""
+    if isinstance(value, FeatureCall):
+        return value
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, float):
+        return float.__repr__(value)
+    if hasattr(value, 'item'):
+        return encode_value(value.item())
+    return json.dumps(value, separators=(',', ':'))
+
+class FeatureTemplate:
+    """The JSON skeleton of a feature type, serialized once, with `Slot` markers for the values that change
+    between features. Filling the template serializes only the slot values and joins them with the
+    precompiled text."""
+    _MARKER = re.compile(r'"\\u0000(\w+)\\u0000"')
+
+    def __init__(self, skeleton: dict):
+        text = json.dumps(skeleton, separators=(',', ':'), default=lambda slot: f'\0{slot.name}\0')
+        parts = self._MARKER.split(text)
+        self.chunks = parts[0::2]
+        self.slots = parts[1::2]
+
+    def fill(self, **values):
+        """Serializes a definition from the template, with `values` keyed by slot name. The value of the `name`
+        slot, if any, is kept on the returned `FeatureCall` to identify the feature without parsing it."""
+        out = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            out.append(encode_value(values[slot]))
+            out.append(chunk)
+        call = FeatureCall(''.join(out))
+        call.name = values.get('name')
+        call._digest = None
+        return call
+
+CIRCLE_TEMPLATE = FeatureTemplate({
+    "btType": "BTMSketchCurve-4",
+    "geometry": {
+        "btType": "BTCurveGeometryCircle-115",
+        "radius": Slot('radius'),
+        "xCenter": Slot('xCenter'),
+        "yCenter": Slot('yCenter'),
+        "xDir": 1,
+        "yDir": 0,
+        "clockwise": False,
+    },
+    "centerId": "circle-entity.center",
+    "entityId": "circle-entity"
+})
+
+SKETCH_TEMPLATE = FeatureTemplate({
+    "btType": "BTFeatureDefinitionCall-1406",
+    "feature" : {
+        "btType": "BTMSketch-151",
+        "featureType": "newSketch",
+        "name": Slot('name'),
+        "parameters" : [
+            {
+            "btType": "BTMParameterQueryList-148",
+            "queries": [Slot('plane_query')],
+            "parameterId": "sketchPlane",
+            }
+        ],
+        "entities": [Slot('circle_call')],
+        "constraints": [],
+    }
+})
+
+# Queries for the plane of a sketch: a face or default plane by deterministic id, or a plane feature by its id
+PLANE_ID_QUERY_TEMPLATE = FeatureTemplate({
+    "btType": "BTMIndividualQuery-138",
+    "deterministicIds": [Slot('plane_id')]
+})
+
+PLANE_FEATURE_QUERY_TEMPLATE = FeatureTemplate({
+    "btType": "BTMIndividualCreatedByQuery-137",
+    "featureId": Slot('feature_id'),
+    "entityType": "FACE"
+})
+
+OFFSET_PLANE_TEMPLATE = FeatureTemplate({
+    "btType": "BTFeatureDefinitionCall-1406",
+    "feature": {
+        "btType": "BTMFeature-134",
+        "featureType": "cPlane",
+        "name": Slot('name'),
+        "parameters": [
+            {
+                "btType": "BTMParameterQueryList-148",
+                "queries": [Slot('base_query')],
+                "parameterId": "entities",
+            }, {
+                "btType": "BTMParameterEnum-145",
+                "value": "OFFSET",
+                "enumName": "CPlaneType",
+                "parameterId": "cplaneType",
+            }, {
+                "btType": "BTMParameterQuantity-147",
+                "expression": Slot('expression'),
+                "parameterId": "offset",
+            }],
+        "returnAfterSubfeatures": False,
+        "suppressed": False,
+    }
+})
+
+EXTRUDE_TEMPLATE = FeatureTemplate({
+    "btType": "BTFeatureDefinitionCall-1406",
+    "feature": {
+        "btType": "BTMFeature-134",
+        "featureType": "extrude",
+        "name": Slot('name'),
+        "parameters": [
+            {
+                "btType": "BTMParameterEnum-145",
+                "value": Slot('body_type'),
+                "enumName": "ExtendedToolBodyType",
+                "parameterId": "bodyType",
+            }, {
+                "btType": "BTMParameterEnum-145",
+                "value": Slot('operationType'),
+                "enumName": "NewBodyOperationType",
+                "parameterId": "operationType",
+            }, {
+                "btType": "BTMParameterQueryList-148",
+                "queries": [{
+                    "btType": "BTMIndividualSketchRegionQuery-140",
+                    "featureId": Slot('feature_id')
+                    }],
+                "parameterId": "entities",
+            }, {
+                "btType": "BTMParameterEnum-145",
+                "value": Slot('endBound'),
+                "enumName": "BoundingType",
+                "parameterId": "endBound",
+            }, {
+                "btType": "BTMParameterQuantity-147",
+                "expression": Slot('expression'),
+                "parameterId": "depth",
+            }],
+        "returnAfterSubfeatures": False,
+        "suppressed": False,
+    }
+})
+
+class LazyNode:
+    """A node attribute of a `NodeBundle` that is only created the first time it is used, so nodes that never
+    enter the graph cost nothing. The label is formatted with the name of the bundle, and the static value is
+    taken from the first of `keys` passed to the bundle, else `default`."""
+    __slots__ = ('slot', 'label', 'keys', 'default', 'is_name')
+
+    def __init__(self, label: str, keys: tuple=(), default=None, is_name: bool=False):
+        self.label = label
+        self.keys = keys
+        self.default = default
+        self.is_name = is_name
+
+    def __set_name__(self, owner, name):
+        self.slot = '_' + name
+
+    def __get__(self, bundle, owner=None):
+        if bundle is None:
+            return self
+        node = getattr(bundle, self.slot)
+        if node is None:
+            value = bundle.label if self.is_name else self.default
+            if bundle._kwargs is not None:
+                for key in self.keys:
+                    if key in bundle._kwargs:
+                        value = bundle._kwargs[key]
+                        break
+            node = Node(self.label.format(bundle.label), value)
+            setattr(bundle, self.slot, node)
+        return node
+
+class NodeBundle:
+    """Base of the compact collections of nodes below. Subclasses declare their nodes as `LazyNode` attributes
+    and a slot (`_` + attribute name) for each."""
+    __slots__ = ('label', '_kwargs')
+    _lazy_slots = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._lazy_slots = tuple(v.slot for k in cls.__mro__ for v in vars(k).values() if isinstance(v, LazyNode))
 
-class CircleEntity:
     def __init__(self, name: str, **kwargs):
-        self.name = Node(f'name for {name}', name)
-        self.radius = Node(f'radius for {name}', kwargs.get('radius', None))
-        self.xCenter = Node(f'xCenter for {name}', kwargs.get('xCenter', None))
-        self.yCenter = Node(f'yCenter for {name}', kwargs.get('yCenter', None))
-        self.call = Node(f'call for {name}', kwargs.get('call', None))
+        self.label = name
+        self._kwargs = kwargs or None
+        for slot in self._lazy_slots:
+            setattr(self, slot, None)
+
+class CircleEntity(NodeBundle):
+    __slots__ = ('_name', '_radius', '_xCenter', '_yCenter', '_call')
+    name = LazyNode('name for {}', is_name=True)
+    radius = LazyNode('radius for {}', ('radius',))
+    xCenter = LazyNode('xCenter for {}', ('xCenter',))
+    yCenter = LazyNode('yCenter for {}', ('yCenter',))
+    call = LazyNode('call for {}', ('call',))
 
     @staticmethod
     def Rget_call(radius, xCenter, yCenter, *args, **kwargs):
         '''An internal relationship that never changes.'''
-        out = {
-            "btType": "BTMSketchCurve-4",
-            "geometry": {
-                "btType": "BTCurveGeometryCircle-115",
-                "radius": radius,  
-                "xCenter": xCenter,
-                "yCenter": yCenter,  
-                "xDir": 1,
-                "yDir": 0, 
-                "clockwise": False, 
-            },
-            "centerId": "circle-entity.center",
-            "entityId": "circle-entity"
-        }
+        out = CIRCLE_TEMPLATE.fill(radius=radius, xCenter=xCenter, yCenter=yCenter)
         return out
 
-class CircleSketch:
-    def __init__(self, name: str, **kwargs):
-        self.name = Node(f'Name for {name}', name)
-        self.id = Node(f'ID for {name}')
-        self.plane_id = Node(f'Deterministic id of plane for {name}', kwargs.get('plane', None))
-        self.call = Node(f'Call for {name}', kwargs.get('call', None))
+class CircleEntityGroup:
+    """A group of circle entities with the same radius whose centers are solved together, as one array, so that
+    the circles of every member take a single edge rather than several each."""
+    def __init__(self, name: str, members: list, **kwargs):
+        self.members = members
+        self.radius = Node(f'radius for {name}', kwargs.get('radius', None))
+        self.centers = Node(f'centers for {name}', kwargs.get('centers', None), description='array of (x, y) rows')
+        self.calls = Node(f'calls for {name}')
+        self.indices = [Node(f'index of {member.label} in {name}', i) for i, member in enumerate(members)]
+
+    @staticmethod
+    def Rget_calls(radius, centers, *args, **kwargs):
+        '''Makes the circle entity of every member, in order.'''
+        out = [CIRCLE_TEMPLATE.fill(radius=radius, xCenter=x, yCenter=y) for x, y in centers.tolist()]
+        return out
+
+    @staticmethod
+    def Rget_member(values, index: int, *args, **kwargs):
+        '''Selects the value of a single member from the values of the group.'''
+        return values[index]
+
+class CircleSketch(NodeBundle):
+    __slots__ = ('_name', '_id', '_plane_id', '_call')
+    name = LazyNode('Name for {}', is_name=True)
+    id = LazyNode('ID for {}')
+    plane_id = LazyNode('Deterministic id of plane for {}', ('plane',))
+    call = LazyNode('Call for {}', ('call',))
 
     @staticmethod
     def Rget_call(name, plane_id, circle_call: str, *args, **kwargs):
-        out = {
-            "btType": "BTFeatureDefinitionCall-1406",
-            "feature" : {
-                "btType": "BTMSketch-151", 
-                "featureType": "newSketch", 
-                "name": name,
-                "parameters" : [
-                    {
-                    "btType": "BTMParameterQueryList-148",
-                    "queries": [
-                        {
-                        "btType": "BTMIndividualQuery-138",
-                        "deterministicIds": [plane_id]
-                        }
-                    ],
-                    "parameterId": "sketchPlane", 
-                    }
-                ]
-            }
-        }
-        out["feature"]["entities"] = [circle_call]
-        out["feature"]["constraints"] = list() 
+        if isinstance(circle_call, dict):
+            circle_call = FeatureCall(json.dumps(circle_call, separators=(',', ':')))
+        out = SKETCH_TEMPLATE.fill(name=name, plane_query=PLANE_ID_QUERY_TEMPLATE.fill(plane_id=plane_id),
+                                   circle_call=circle_call)
         return out
 
-class Cylinder:
-    def __init__(self, name: str, **kwargs):
-        self.name = Node(f'Name for {name}', name)
-        self.id = Node(f'ID for {name}')
-        self.operationType = Node(f'OperationType for {name}', kwargs.get('operation_type', SMNewBodyOperationType.NEW))
-        self.endBound = Node(f'endBound for {name}', SMExtrudeBoundingTypes.BLIND)
-        self.depth = Node(f'depth of {name}', kwargs.get('depth', None))
-        self.call = Node(f'Call for {name}', kwargs.get('call', None))
+    @staticmethod
+    def Rget_call_on_plane(name, plane_feature_id, circle_call: str, *args, **kwargs):
+        """Makes the sketch on the plane created by a plane feature (e.g. an `OffsetPlane`)."""
+        if isinstance(circle_call, dict):
+            circle_call = FeatureCall(json.dumps(circle_call, separators=(',', ':')))
+        plane_query = PLANE_FEATURE_QUERY_TEMPLATE.fill(feature_id=plane_feature_id)
+        out = SKETCH_TEMPLATE.fill(name=name, plane_query=plane_query, circle_call=circle_call)
+        return out
+
+class OffsetPlane(NodeBundle):
+    """A construction plane parallel to a base plane, offset along its normal."""
+    __slots__ = ('_name', '_id', '_offset', '_call')
+    name = LazyNode('Name for {}', is_name=True)
+    id = LazyNode('ID for {}')
+    offset = LazyNode('offset of {}', ('offset',))
+    call = LazyNode('Call for {}', ('call',))
+
+    @staticmethod
+    def Rget_call(name: str, base_plane_id: str, offset: float, *args, **kwargs):
+        """Makes the JSON output for a plane `offset` from the plane with the deterministic id `base_plane_id`."""
+        units = kwargs.get('units', 'mm')
+        out = OFFSET_PLANE_TEMPLATE.fill(name=name, base_query=PLANE_ID_QUERY_TEMPLATE.fill(plane_id=base_plane_id),
+                                         expression=f"{offset} {units}")
+        return out
+
+class Cylinder(NodeBundle):
+    __slots__ = ('_name', '_id', '_operationType', '_endBound', '_depth', '_call')
+    name = LazyNode('Name for {}', is_name=True)
+    id = LazyNode('ID for {}')
+    operationType = LazyNode('OperationType for {}', ('operationType', 'operation_type'), SMNewBodyOperationType.NEW)
+    endBound = LazyNode('endBound for {}', default=SMExtrudeBoundingTypes.BLIND)
+    depth = LazyNode('depth of {}', ('depth',))
+    call = LazyNode('Call for {}', ('call',))
 
     @staticmethod
     def Rget_extrusion_call(name: str, feature_id: str, depth: float, endBound: SMExtrudeBoundingTypes, operationType: SMNewBodyOperationType, *args, **kwargs):
@@ -81,44 +316,38 @@ class Cylinder:
         )
         kwargs = defaults | kwargs
 
-        params = [
-            dict(
-                btType = "BTMParameterEnum-145",
-                value = kwargs['body_type'],
-                enumName = "ExtendedToolBodyType",
-                parameterId = "bodyType",
-            ), dict(
-                btType = "BTMParameterEnum-145",
-                value = operationType,
-                enumName = "NewBodyOperationType",
-                parameterId = "operationType",
-            ), dict(
-                btType = "BTMParameterQueryList-148",
-                queries = [{
-                    "btType": "BTMIndividualSketchRegionQuery-140",
-                    "featureId": feature_id
-                    }],
-                parameterId = "entities",
-            ), dict(
-                btType = "BTMParameterEnum-145",
-                value = str(endBound),
-                enumName = "BoundingType",
-                parameterId = "endBound",
-            ), dict(
-                btType = "BTMParameterQuantity-147",
-                expression = f"{depth} {kwargs['units']}",
-                parameterId = "depth",
-            )]
-        feature = dict(
-            btType = "BTMFeature-134",
-            featureType = "extrude",
-            name = name,
-            parameters = params,
-            returnAfterSubfeatures = False,
-            suppressed = False,
-        )
-        out = dict(
-            btType = "BTFeatureDefinitionCall-1406",
-            feature = feature,
-        )
-        return json.dumps(out)
+        out = EXTRUDE_TEMPLATE.fill(name=name, body_type=kwargs['body_type'], operationType=operationType,
+                                    feature_id=feature_id, endBound=str(endBound),
+                                    expression=f"{depth} {kwargs['units']}")
+        return out
+
+class PartMassProperties(NodeBundle):
+    """The mass properties of a part, filled from the `MassPropertiesTable` of its part studio (see
+    `crankshaftchg_rels.Rget_mass_properties_table`)."""
+    __slots__ = ('_part_id', '_mass', '_centroid', '_inertia', '_principal_inertia', '_principal_axes')
+    part_id = LazyNode('part id of {}', ('part_id',))
+    mass = LazyNode('mass of {}')
+    centroid = LazyNode('centroid of {}')
+    inertia = LazyNode('inertia tensor of {}')
+    principal_inertia = LazyNode('principal moments of inertia of {}')
+    principal_axes = LazyNode('principal axes of {}')
+
+    @staticmethod
+    def Rget_mass(table, part_id: str, *args, **kwargs):
+        return float(table.mass[table.index[part_id]])
+
+    @staticmethod
+    def Rget_centroid(table, part_id: str, *args, **kwargs):
+        return table.centroid[table.index[part_id]]
+
+    @staticmethod
+    def Rget_inertia(table, part_id: str, *args, **kwargs):
+        return table.inertia[table.index[part_id]]
+
+    @staticmethod
+    def Rget_principal_inertia(table, part_id: str, *args, **kwargs):
+        return table.principal_inertia[table.index[part_id]]
+
+    @staticmethod
+    def Rget_principal_axes(table, part_id: str, *args, **kwargs):
+        return table.principal_axes[table.index[part_id]]
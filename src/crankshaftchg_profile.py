@@ -0,0 +1,226 @@
+"""Profiles the relations of a hypergraph solve, attributing the time of each edge to its target node.
+
+`RelationProfiler.wrap` is passed as the `wrap` of `build_crankshaft_graph`, and wraps the relation of every
+edge: the functions of `crankshaftchg_rels`, the `Rget_call` methods of `crankshaftchg_objects` and the
+relations of `constrainthg.relations` alike. For each edge it records the number of calls, the wall time, the
+time spent waiting on HTTP requests (the rest being local compute), the number and size of the responses, and
+the bytes out: the size of the request bodies sent, or of the feature definitions built. Requests are
+attributed to the relation running on the same thread, through the `ProfilingTracer` given to every relation
+that takes a `tracer` (the client is made by `Rmake_client`), so the profile also holds for the concurrent
+solver of `crankshaftchg_solver`.
+
+The time of a solve not spent in relations is the overhead of the hypergraph itself (its search over edges).
+
+    profiler = RelationProfiler()
+    chg, handles = build_crankshaft_graph(params, wrap=profiler.wrap)
+    with profiler.measure():
+        t, solved_values = chg.solve(handles['target'])
+    profiler.print_report()
+    profiler.write_collapsed('solve.folded')  # for flamegraph.pl or speedscope
+
+    python crankshaftchg_profile.py --pins 4 --latency 0.02 --out solve.folded
+"""
+import os
+import sys
+import time
+import inspect
+import argparse
+import functools
+import threading
+import contextlib
+
+from onshape_api.utils import RequestTracer
+from crankshaftchg_objects import FeatureCall
+
+REPORT_SORTS = ('wall', 'http', 'compute', 'calls', 'bytes_in', 'bytes_out')
+
+class ProfilingTracer(RequestTracer):
+    """A request tracer that also adds each request to the relation call running on its thread."""
+    def __init__(self, maxlen: int=100000):
+        super().__init__(maxlen)
+        self._calls = threading.local()
+
+    def begin(self, stats: dict):
+        """Marks the start of a relation call on this thread, whose requests are added to `stats`."""
+        stack = getattr(self._calls, 'stack', None)
+        if stack is None:
+            stack = self._calls.stack = []
+        stack.append(stats)
+
+    def end(self):
+        """Marks the end of the innermost relation call on this thread."""
+        self._calls.stack.pop()
+
+    def record(self, method, path, status, nbytes=None, nbytes_sent=None, dns=None, connect=None, ttfb=None,
+               total=None, retries=0):
+        super().record(method, path, status, nbytes=nbytes, nbytes_sent=nbytes_sent, dns=dns, connect=connect,
+                       ttfb=ttfb, total=total, retries=retries)
+        stack = getattr(self._calls, 'stack', None)
+        if stack:
+            stats = stack[-1]
+            stats['requests'] += 1
+            stats['http'] += total or 0.
+            stats['bytes_in'] += nbytes or 0
+            stats['bytes_out'] += nbytes_sent or 0
+
+def payload_size(value) -> int:
+    """Size of the feature definitions in a result (a `FeatureCall` or a list of them), else 0."""
+    if isinstance(value, FeatureCall):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(len(v) for v in value if isinstance(v, FeatureCall))
+    return 0
+
+class RelationProfiler:
+    """Records the calls to the relations of a hypergraph, per edge (keyed by the label of its target)."""
+    def __init__(self):
+        self.tracer = ProfilingTracer()
+        self.edges = {}
+        self.solve_time = None
+        self._lock = threading.Lock()
+
+    def wrap(self, rel, label: str):
+        """Returns the profiled version of the relation of the edge to `label`. Pass as the `wrap` of
+        `build_crankshaft_graph`."""
+        stats = self.edges.setdefault(label, dict(rel=getattr(inspect.unwrap(rel), '__qualname__', repr(rel)),
+                                                  calls=0, wall=0., http=0., requests=0, bytes_in=0, bytes_out=0))
+        takes_tracer = 'tracer' in inspect.signature(rel).parameters
+
+        @functools.wraps(rel)
+        def profiled(*args, **kwargs):
+            if takes_tracer:
+                kwargs.setdefault('tracer', self.tracer)
+            call = dict(http=0., requests=0, bytes_in=0, bytes_out=0)
+            self.tracer.begin(call)
+            start = time.perf_counter()
+            try:
+                out = rel(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - start
+                self.tracer.end()
+                with self._lock:
+                    stats['calls'] += 1
+                    stats['wall'] += wall
+                    for key in call:
+                        stats[key] += call[key]
+            with self._lock:
+                stats['bytes_out'] += payload_size(out)
+            return out
+        return profiled
+
+    @contextlib.contextmanager
+    def measure(self):
+        """Times the solve run in the context, to report the overhead of the hypergraph."""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.solve_time = time.perf_counter() - start
+
+    def rows(self, sort: str='wall'):
+        """Returns the statistics of every edge that was called, with its `label` and `compute` time, in
+        decreasing order of `sort`."""
+        out = []
+        for label, stats in self.edges.items():
+            if stats['calls'] > 0:
+                out.append(dict(label=label, **stats, compute=max(stats['wall'] - stats['http'], 0.)))
+        return sorted(out, key=lambda row: row[sort], reverse=True)
+
+    def totals(self):
+        """Sums the statistics over all edges, by relation, and overall (under `None`)."""
+        totals = {}
+        for row in self.rows():
+            for key in (row['rel'], None):
+                total = totals.setdefault(key, dict(edges=0, calls=0, wall=0., http=0., compute=0., requests=0,
+                                                    bytes_in=0, bytes_out=0))
+                total['edges'] += 1
+                for field in ('calls', 'wall', 'http', 'compute', 'requests', 'bytes_in', 'bytes_out'):
+                    total[field] += row[field]
+        return totals
+
+    def print_report(self, sort: str='wall', top: int=20):
+        """Prints the time spent per relation and in the `top` edges, sorted by `sort`."""
+        totals = self.totals()
+        overall = totals.pop(None, None)
+        if overall is None:
+            print('no relations were called')
+            return
+
+        header = f"{'calls':>6} {'wall s':>8} {'http s':>8} {'compute s':>9} {'reqs':>5} {'in kB':>8} {'out kB':>8}"
+        def line(stats):
+            return (f"{stats['calls']:>6} {stats['wall']:>8.3f} {stats['http']:>8.3f} {stats['compute']:>9.3f} "
+                    f"{stats['requests']:>5} {stats['bytes_in'] / 1e3:>8.1f} {stats['bytes_out'] / 1e3:>8.1f}")
+
+        if self.solve_time is not None:
+            # In a concurrent solve the relations overlap, so their wall times can add up to more than the solve
+            overhead = max(self.solve_time - overall['wall'], 0.)
+            print(f"solve {self.solve_time:.3f} s: {overall['http']:.3f} s http, {overall['compute']:.3f} s compute "
+                  f"in relations, {overhead:.3f} s hypergraph overhead")
+        print(f"\n{'relation':<48} {'edges':>6} " + header)
+        for rel, stats in sorted(totals.items(), key=lambda item: item[1][sort], reverse=True):
+            print(f"{rel[:48]:<48} {stats['edges']:>6} " + line(stats))
+        print(f"\n{'edge (target node)':<55} " + header)
+        for row in self.rows(sort)[:top]:
+            print(f"{row['label'][:55]:<55} " + line(row))
+
+    def collapsed(self):
+        """Returns the profile in the collapsed stack format of flamegraph.pl (`frame;frame;... count`), with
+        one stack per relation and edge, split into HTTP and compute, counted in microseconds."""
+        lines = []
+        for row in self.rows():
+            frames = ['solve', row['rel'], row['label'].replace(';', ',')]
+            for part in ('http', 'compute'):
+                us = round(row[part] * 1e6)
+                if us > 0:
+                    lines.append(';'.join(frames + [part]) + f' {us}')
+        if self.solve_time is not None:
+            called = self.totals().get(None)
+            overhead = round(max(self.solve_time - (called['wall'] if called else 0.), 0.) * 1e6)
+            if overhead > 0:
+                lines.append(f'solve;hypergraph overhead {overhead}')
+        return '\n'.join(lines) + '\n'
+
+    def write_collapsed(self, file_path: str):
+        """Writes the profile in the collapsed stack format to a file."""
+        with open(file_path, 'w') as f:
+            f.write(self.collapsed())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pins', type=int, default=4, help='number of pins')
+    parser.add_argument('--construction', choices=['chained', 'offset'], default='chained',
+                        help='sketch each section on the previous extrude, or on an offset plane')
+    parser.add_argument('--solver', choices=['hypergraph', 'dataflow'], default='hypergraph',
+                        help='solve with Hypergraph.solve, or run the requests concurrently')
+    parser.add_argument('--latency', type=float, default=0., help='seconds of latency added by the stand-in per request')
+    parser.add_argument('--sort', choices=REPORT_SORTS, default='wall', help='column to sort the report by')
+    parser.add_argument('--top', type=int, default=20, help='number of edges to report')
+    parser.add_argument('--out', default=None, help='file to write the collapsed stacks to, for a flamegraph')
+    args = parser.parse_args(argv)
+
+    import tempfile
+    from crankshaft_chg import build_crankshaft_graph
+    from crankshaftchg_solver import solve
+    from onshape_api.standin import StandInServer
+
+    profiler = RelationProfiler()
+    with StandInServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        creds = os.path.join(tmp, 'creds.json')
+        server.write_creds(creds)
+        params = dict(num_pins=args.pins, construction=args.construction, stack=server.url, cred_filepath=creds,
+                      did='profiledoc', wvmid='profilews', eid='profile')
+        chg, handles = build_crankshaft_graph(params, wrap=profiler.wrap)
+        with profiler.measure():
+            if args.solver == 'dataflow':
+                solve(chg, handles['target'])
+            else:
+                chg.solve(handles['target'])
+
+    profiler.print_report(args.sort, args.top)
+    if args.out is not None:
+        profiler.write_collapsed(args.out)
+        print(f'\ncollapsed stacks written to {args.out}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,41 +1,85 @@
-import numpy as np
-import crankshaftchg_objects as obj
-from onshape_api.client import Client
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+# numpy and the Onshape client (requests) are imported by the relations that use them, so that importing the
+# relations is fast
+if TYPE_CHECKING:
+    from onshape_api.client import Client
+    from onshape_api.ledger import FeatureLedger
+
+def Rhalf(s1: float, *args, **kwargs):
+    '''Returns half of the value, e.g. a radius from a diameter.'''
+    return s1 / 2
+
+def Rmake_client(cred_path: str, stack: str, tracer=None, *args, **kwargs):
+    '''Creates the client for the Onshape stack, recording its requests with `tracer` if given.'''
+    from onshape_api.client import Client
+    return Client(stack=stack, creds=cred_path, logging=False, tracer=tracer)
 
 def Rget_pin_center_x(angle: float, offset: float, center_x: float, *args, **kwargs):
     '''Calculates the horizontal center of the crank pin based on the orientation of the pin when the first piston
     is TDC.'''
+    import numpy as np
     pin_x = -offset * np.sin(angle) + center_x
     return pin_x
 
 def Rget_pin_center_y(angle: float, offset: float, center_y: float, *args, **kwargs):
     '''Calculates the vertical center of the crank pin based on the orientation of the pin when the first piston
     is TDC.'''
+    import numpy as np
     pin_y = offset * np.cos(angle) + center_y
     return pin_y
 
+def Rget_pin_centers(offset: float, center_x: float, center_y: float, *args, **kwargs):
+    '''Calculates the centers of all the crank pins at once, based on the orientation of each pin (passed as 
+    `angle0`, `angle1`, ...) when the first piston is TDC. Returns an array with a row of (x, y) for each pin.'''
+    import numpy as np
+    keys = sorted((key for key in kwargs if key.startswith('angle')), key=lambda key: int(key[5:]))
+    angles = np.array([kwargs[key] for key in keys], dtype=float)
+    centers = np.column_stack((-offset * np.sin(angles) + center_x, offset * np.cos(angles) + center_y))
+    return centers
+
+def Rget_last_id(*args, **kwargs):
+    '''Returns the last of the featureIds passed as `id0`, `id1`, ..., which is only known once every one of them
+    is, so that solving for it pushes all the features.'''
+    return kwargs[f'id{len(kwargs) - 1}']
+
 def Radd_feature_and_get_id(call: str, did: str, wid: str, eid: str, client: Client, *args, **kwargs):
     '''Adds a new feature (specified by the call) to the Onshape document.'''
     response = client.add_feature(did, wid, eid, call)
+    response.raise_for_status()
     id = response.json()['feature']['featureId']
     return id
 
+def Rupsert_feature_and_get_id(call: str, did: str, wid: str, eid: str, client: Client, ledger: FeatureLedger, *args, **kwargs):
+    '''Pushes a feature to the Onshape document only if it changed since the last run recorded in the ledger,
+    updating it in place (keeping its featureId) rather than adding a new feature.'''
+    id = client.upsert_feature(did, wid, eid, call, ledger)
+    return id
+
 def Rget_plane_id(face_id: str, did: str, wid: str, eid: str, client: Client, *args, **kwargs):
     """Returns the deterministic ID for the plane extracted from a feature."""
-    query = f'qCreatedBy(makeId("{face_id}"), EntityType.FACE)'
-    query_script = f'function(context is Context, queries) {{ return transientQueriesToStrings(evaluateQuery(context, {query})); }}'
-    response = client.execute_feature_script(did, wid, eid, query_script)
-    plane_id = response.json()['result']['message']['value'][-1]['message']['value']
+    plane_id = client.get_face_ids(did, wid, eid, [face_id])[face_id][-1]
     return plane_id
 
 def Rget_mass(part_id: str, did: str, wid: str, eid: str, client: Client, *args, **kwargs):
     """Returns the mass of the part."""
-    response = client.get_mass_properties(did, wid, eid, part_id)
-    mass = response.json()['bodies']['additionalProp1']['mass'][0]
+    mass_properties = client.get_cached_mass_properties(did, wid, eid, part_id)
+    mass = mass_properties['bodies'][part_id]['mass'][0]
     return mass
 
 def Rget_moment_of_inertia(axis: str, part_id: str, did: str, wid: str, eid: str, client: Client, *args, **kwargs):
     """Returns the moment of inertia around the principle axis (`x`, `y`, or `z`)"""
-    response = client.get_mass_properties(did, wid, eid, part_id)
-    moi = response.json()['bodies']['additionalProp1']['principalAxes'][0][axis]
-    return moi 
\ No newline at end of file
+    mass_properties = client.get_cached_mass_properties(did, wid, eid, part_id)
+    moi = mass_properties['bodies'][part_id]['principalInertia']['xyz'.index(axis)]
+    return moi 
+
+def Rget_mass_properties_table(did: str, wid: str, eid: str, client: Client, *args, **kwargs):
+    """Returns the mass properties of every part in the part studio, with a single request. Other inputs (e.g.
+    the id of the last feature) only make the request wait until the part studio is modeled."""
+    table = client.get_partstudio_mass_properties(did, wid, eid)
+    return table
+
+# Relations that wait on the Onshape API rather than compute, which a concurrent solver can run on a thread pool
+IO_RELATIONS = {Radd_feature_and_get_id, Rupsert_feature_and_get_id, Rget_plane_id, Rget_mass, Rget_moment_of_inertia,
+                Rget_mass_properties_table}
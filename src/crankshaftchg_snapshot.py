@@ -0,0 +1,176 @@
+"""Saves a built constraint hypergraph to a JSON snapshot file, and loads it back without rebuilding it.
+
+Relations are stored by name (`module:qualname`), so every relation in the graph must be importable: a module
+level function or a static method, not a lambda. Wrapped relations (e.g. by `RelationMemo.wrap` or
+`RelationProfiler.wrap`) are stored as the relation they wrap, so are loaded without their wrapper. Static values
+may be JSON values, enums, or one of the objects in `RESTORABLE`. The handles returned by `build_crankshaft_graph`
+are stored with the graph, with their nodes stored by label. The graph is rebuilt through the public API of
+constrainthg (`Hypergraph.insert_node` and `Hypergraph.add_edge`), so snapshots do not depend on its version.
+
+    chg, handles = build_crankshaft_graph(params)
+    save_snapshot(chg, handles, 'crankshaft.chg.json')
+    ...
+    chg, handles = load_snapshot('crankshaft.chg.json')
+    t, solved_values = chg.solve(handles['target'])
+"""
+import gc
+import json
+import inspect
+import importlib
+from enum import Enum
+
+from constrainthg import Node, Hypergraph, Edge
+
+SNAPSHOT_VERSION = 1
+
+# Objects that can be static values, with the attributes passed back to their constructor when loaded
+RESTORABLE = {
+    'onshape_api.ledger:FeatureLedger': ('file_path',),
+}
+
+def name_of(value):
+    """Returns the importable name (`module:qualname`) of a function or class."""
+    return f'{value.__module__}:{value.__qualname__}'
+
+def resolve(name: str):
+    """Imports the function or class named by `name_of`."""
+    module, qualname = name.split(':')
+    value = importlib.import_module(module)
+    for attr in qualname.split('.'):
+        value = getattr(value, attr)
+    return value
+
+def encode_rel(rel):
+    """Returns the name of a relation (or of the relation it wraps), checking that it resolves back to the same
+    function."""
+    rel = inspect.unwrap(rel)
+    name = name_of(rel)
+    try:
+        found = resolve(name)
+    except (AttributeError, ImportError, ValueError):
+        found = None
+    if found is not rel:
+        raise ValueError(f'relation {name} cannot be imported by name; use a module level function instead of a lambda')
+    return name
+
+def encode_value(value):
+    """Encodes a static value of a node as JSON."""
+    if isinstance(value, Enum):
+        return {'$enum': name_of(type(value)), 'value': value.value}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        if any(k.startswith('$') for k in value):
+            raise ValueError('keys of static values cannot start with $')
+        return {k: encode_value(v) for k, v in value.items()}
+    name = name_of(type(value))
+    if name in RESTORABLE:
+        return {'$object': name, 'args': {attr: getattr(value, attr) for attr in RESTORABLE[name]}}
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'static value of type {name} cannot be saved in a snapshot')
+
+def decode_value(value):
+    """Decodes a static value encoded by `encode_value`."""
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if isinstance(value, dict):
+        if '$enum' in value:
+            return resolve(value['$enum'])(value['value'])
+        if '$object' in value:
+            return resolve(value['$object'])(**value['args'])
+        return {k: decode_value(v) for k, v in value.items()}
+    return value
+
+def encode_handle(handle, nodes: dict):
+    """Encodes a handle, replacing the nodes of the hypergraph (`nodes`) by their labels; other nodes are stored
+    whole. Objects holding nodes (e.g. the bundles of `crankshaftchg_objects`) are stored by class with their
+    attributes."""
+    if isinstance(handle, Node):
+        if nodes.get(handle.label) is handle:
+            return {'$node': handle.label}
+        return {'$free_node': [handle.label, encode_value(handle.static_value), handle.description]}
+    if isinstance(handle, (list, tuple)):
+        return [encode_handle(h, nodes) for h in handle]
+    if isinstance(handle, dict):
+        return {k: encode_handle(v, nodes) for k, v in handle.items()}
+    if handle is None or isinstance(handle, (str, int, float, bool)):
+        return handle
+    slots = [s for cls in type(handle).__mro__ for s in getattr(cls, '__slots__', ())]
+    attrs = {s: getattr(handle, s) for s in slots} | getattr(handle, '__dict__', {})
+    return {'$handle': name_of(type(handle)), 'attrs': {k: encode_handle(v, nodes) for k, v in attrs.items()}}
+
+def decode_handle(handle, nodes: dict):
+    """Decodes a handle encoded by `encode_handle`, taking its nodes from `nodes`."""
+    if isinstance(handle, list):
+        return [decode_handle(h, nodes) for h in handle]
+    if isinstance(handle, dict):
+        if '$node' in handle:
+            return nodes[handle['$node']]
+        if '$free_node' in handle:
+            label, value, description = handle['$free_node']
+            return Node(label, decode_value(value), description=description)
+        if '$handle' in handle:
+            cls = resolve(handle['$handle'])
+            out = cls.__new__(cls)
+            for k, v in handle['attrs'].items():
+                setattr(out, k, decode_handle(v, nodes))
+            return out
+        return {k: decode_handle(v, nodes) for k, v in handle.items()}
+    return handle
+
+def save_snapshot(chg: Hypergraph, handles: dict, file_path: str):
+    """Saves the hypergraph and its handles to a JSON snapshot file."""
+    nodes = [[node.label, encode_value(node.static_value), node.description] for node in chg.nodes.values()]
+    edges = []
+    for edge in chg.edges.values():
+        if (edge.via is not Edge.via_true or getattr(edge, 'index_via', Edge.via_true) is not Edge.via_true
+                or edge.edge_props or edge.index_offset or getattr(edge, 'disposable', None)):
+            raise ValueError(f'edge {edge.label} has a via function, index offset, disposable sources or properties, '
+                             'which snapshots do not support')
+        sources = {}
+        for key, sn in edge.source_nodes.items():
+            if isinstance(sn, tuple):
+                raise ValueError(f'edge {edge.label} has a pseudo node, which snapshots do not support')
+            sources[key] = sn.label
+        edges.append([edge.label, sources, edge.target.label, encode_rel(edge.rel), edge.weight])
+
+    snapshot = dict(version=SNAPSHOT_VERSION, nodes=nodes, edges=edges, handles=encode_handle(handles, chg.nodes))
+    with open(file_path, 'w') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+
+def load_snapshot(file_path: str):
+    """Loads a hypergraph and its handles from a snapshot file written by `save_snapshot`.
+
+    Nodes and edges are referenced by label, so adding them does not merge nodes or search for free labels.
+    """
+    # The graph is a large number of small objects that reference each other, and none of them are garbage
+    # until it is loaded, so the collector is paused rather than scanning them over and over
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _load_snapshot(file_path)
+    finally:
+        if enabled:
+            gc.enable()
+
+def _load_snapshot(file_path: str):
+    with open(file_path) as f:
+        snapshot = json.load(f)
+    if snapshot['version'] != SNAPSHOT_VERSION:
+        raise ValueError(f"snapshot version {snapshot['version']} is not supported")
+
+    chg = Hypergraph()
+    for label, value, description in snapshot['nodes']:
+        chg.insert_node(Node(label, decode_value(value), description=description))
+
+    rels = {}
+    for label, sources, target, rel, weight in snapshot['edges']:
+        if rel not in rels:
+            rels[rel] = resolve(rel)
+        chg.add_edge(sources, target, rels[rel], weight=weight, label=label)
+
+    handles = decode_handle(snapshot['handles'], chg.nodes)
+    return chg, handles
@@ -0,0 +1,192 @@
+"""A dataflow solver for constraint hypergraphs whose relations wait on the network.
+
+`Hypergraph.solve` runs every edge in turn on one thread, so a solve takes as long as all of its requests put
+together. `solve` here instead runs each edge as soon as all its sources are known: relations in `io_rels`
+(by default the Onshape requests in `crankshaftchg_rels.IO_RELATIONS`) are run on a thread pool, and all other
+relations, which only compute, are run inline. The solve then takes about as long as its critical path, the
+slowest chain of dependent edges.
+
+The solver follows one generating edge per node: the first one, in the order the edges were added, whose
+sources can all be solved. This suits graphs like the crankshaft, where each node has a single way to be
+found; use `Hypergraph.solve` for graphs that need its search over alternative paths.
+
+    chg, handles = build_crankshaft_graph(params)
+    value, found_values, report = solve(chg, handles['target'])
+    print_report(report)
+"""
+import time
+import inspect
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from constrainthg import Hypergraph
+from crankshaftchg_rels import IO_RELATIONS
+
+def plan(chg: Hypergraph, target, node_values: dict=None):
+    """Chooses the edges needed to solve for `target`, returning the known source values (by label) and the
+    chosen edges in dependency order."""
+    known = {label: node.static_value for label, node in chg.nodes.items() if node.static_value is not None}
+    known.update(node_values or {})
+    rank = {label: i for i, label in enumerate(chg.edges)}
+    solvable, order = {}, []
+
+    # Depth first search without recursion, as the sections of a crankshaft make long chains of edges. Each
+    # frame is [label, generating edges, index of the edge tried, index of the source checked].
+    target = chg.get_node(target)
+    stack = [[target.label, None, 0, 0]]
+    on_stack = {target.label}
+    while stack:
+        frame = stack[-1]
+        label, edges, e, s = frame
+        if edges is None:
+            if label in known:
+                solvable[label] = True
+                stack.pop()
+                on_stack.discard(label)
+                continue
+            edges = frame[1] = sorted(chg.nodes[label].generating_edges, key=lambda edge: rank[edge.label])
+        if e == len(edges):
+            solvable[label] = False
+            stack.pop()
+            on_stack.discard(label)
+            continue
+
+        sources = list(edges[e].source_nodes.values())
+        if s < len(sources):
+            source = sources[s]
+            if isinstance(source, tuple):
+                raise ValueError(f'edge {edges[e].label} has a pseudo node, which the dataflow solver does not support')
+            if solvable.get(source.label):
+                frame[3] += 1
+            elif source.label in solvable or source.label in on_stack:
+                frame[2], frame[3] = e + 1, 0  # unsolvable, or a cycle: try the next edge
+            else:
+                stack.append([source.label, None, 0, 0])
+                on_stack.add(source.label)
+            continue
+
+        solvable[label] = True
+        order.append(edges[e])
+        stack.pop()
+        on_stack.discard(label)
+
+    if not solvable[target.label]:
+        raise ValueError(f'no solution found for {target.label}')
+    return known, order
+
+def is_io(rel, io_rels) -> bool:
+    """Whether a relation (or the relation it wraps) waits on I/O."""
+    return rel in io_rels or inspect.unwrap(rel) in io_rels
+
+def solve(chg: Hypergraph, target, node_values: dict=None, max_workers: int=8, io_rels=IO_RELATIONS):
+    """Solves for `target`, running each edge as soon as its sources are known.
+
+    Parameters
+    ----------
+    chg : Hypergraph
+        The hypergraph to solve.
+    target : Node | str
+        The node or label of the node to solve for.
+    node_values : dict, optional
+        Values of nodes by label, overriding their static values.
+    max_workers : int, default=8
+        Largest number of I/O relations run at the same time.
+    io_rels : set, default=IO_RELATIONS
+        Relations to run on the thread pool; all others are run inline.
+
+    Returns
+    -------
+    Any
+        The value of the target.
+    dict
+        The value of every node found, by label.
+    dict
+        A report of the solve: the number of edges and of I/O edges, the wall time, the time spent in
+        relations (`busy_time`), the critical path, the average and largest number of I/O relations in
+        flight, and the achieved parallelism (`busy_time / wall_time`).
+    """
+    target = chg.get_node(target)
+    values, order = plan(chg, target, node_values)
+
+    # Edges wait on the number of their sources that are not known yet
+    waiting, dependents = {}, {}
+    for edge in order:
+        labels = {sn.label for sn in edge.source_nodes.values()}
+        waiting[edge.label] = sum(label not in values for label in labels)
+        for label in labels:
+            dependents.setdefault(label, []).append(edge)
+    ready = [edge for edge in order if waiting[edge.label] == 0]
+
+    finished = {label: 0. for label in values}  # time from the start at which each value was known
+    durations = {}
+    busy, max_in_flight, in_flight_time = 0., 0, 0.
+    futures = {}
+    start = time.perf_counter()
+    last = start
+
+    def run(edge):
+        t = time.perf_counter()
+        kwargs = {key: values[sn.label] for key, sn in edge.source_nodes.items()}
+        value = edge.process_values(kwargs)
+        return value, time.perf_counter() - t
+
+    def complete(edge, value, duration):
+        nonlocal busy
+        label = edge.target.label
+        values[label] = value
+        durations[edge.label] = duration
+        busy += duration
+        finished[label] = duration + max(finished[sn.label] for sn in edge.source_nodes.values())
+        for dependent in dependents.get(label, ()):
+            waiting[dependent.label] -= 1
+            if waiting[dependent.label] == 0:
+                ready.append(dependent)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while ready or futures:
+            while ready:
+                edge = ready.pop()
+                if edge.target.label in values:
+                    continue
+                if is_io(edge.rel, io_rels):
+                    futures[pool.submit(run, edge)] = edge
+                else:
+                    value, duration = run(edge)
+                    complete(edge, value, duration)
+            if not futures:
+                break
+
+            # Futures beyond the size of the pool are queued, not in flight
+            in_flight = min(len(futures), max_workers)
+            now = time.perf_counter()
+            in_flight_time += in_flight * (now - last)
+            last = now
+            max_in_flight = max(max_in_flight, in_flight)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            now = time.perf_counter()
+            in_flight_time += in_flight * (now - last)
+            last = now
+            for future in done:
+                edge = futures.pop(future)
+                value, duration = future.result()
+                complete(edge, value, duration)
+
+    wall_time = time.perf_counter() - start
+    report = dict(
+        edges = len(durations),
+        io_edges = sum(is_io(edge.rel, io_rels) for edge in order),
+        wall_time = wall_time,
+        busy_time = busy,
+        critical_path = finished.get(target.label, 0.),
+        mean_in_flight = in_flight_time / wall_time if wall_time > 0 else 0.,
+        max_in_flight = max_in_flight,
+        parallelism = busy / wall_time if wall_time > 0 else 0.,
+    )
+    if target.label not in values or values[target.label] is None:
+        raise ValueError(f'no solution found for {target.label}')
+    return values[target.label], values, report
+
+def print_report(report: dict):
+    """Prints the report of a solve."""
+    print(f"{report['edges']} edges ({report['io_edges']} I/O) in {report['wall_time']:.3f} s, "
+          f"critical path {report['critical_path']:.3f} s, parallelism {report['parallelism']:.2f} "
+          f"(mean {report['mean_in_flight']:.2f}, max {report['max_in_flight']} requests in flight)")
@@ -8,4 +8,4 @@ Demonstrates usage of API keys for the Onshape REST API
 __copyright__ = 'Copyright (c) 2016 Onshape, Inc.'
 __license__ = 'All rights reserved.'
 __title__ = 'apikey'
-__all__ = ['onshape', 'client', 'utils']
+__all__ = ['onshape', 'client', 'async_client', 'cache', 'transport', 'standin', 'geometry', 'multipart', 'ledger', 'scheduler', 'utils']
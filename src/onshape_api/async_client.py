@@ -0,0 +1,366 @@
+'''
+async_client
+============
+
+Asyncio versions of the Onshape API and client, for keeping many requests in
+flight from a single event loop
+'''
+
+from onshape_api import utils
+from onshape_api.onshape import Onshape
+from onshape_api.client import Client
+
+import asyncio
+import json
+import urllib.parse as urlparse
+from urllib.parse import parse_qs
+
+import aiohttp
+
+__all__ = [
+    'AsyncOnshape',
+    'AsyncClient'
+]
+
+
+class AsyncOnshape(Onshape):
+    '''
+    Provides asynchronous access to the Onshape REST API. Requests are signed
+    exactly as in `Onshape`, but are issued through an aiohttp session and must
+    be awaited. They are sent as they come, up to `max_in_flight` at a time,
+    without the response cache, tracer or scheduler of `Onshape`.
+
+    Attributes:
+        - stack (str): Base URL
+        - creds (str, default='./creds.json'): Credentials location
+        - logging (bool, default=True): Turn logging on or off
+        - max_in_flight (int, default=100): Maximum number of concurrent requests
+    '''
+
+    def __init__(self, stack, creds='./creds.json', logging=True, max_in_flight=100):
+        '''
+        Instantiates an instance of the AsyncOnshape class. Credentials are read as
+        for `Onshape`.
+
+        Args:
+            - stack (str): Base URL
+            - creds (str, default='./creds.json'): Credentials location
+            - logging (bool, default=True): Turn logging on or off
+            - max_in_flight (int, default=100): Maximum number of concurrent requests
+        '''
+
+        self._read_creds(stack, creds, logging)
+        self._max_in_flight = max_in_flight
+        self._semaphore = None
+        self._async_session = None
+
+        if self._logging:
+            utils.log('onshape instance created: url = %s, access key = %s' % (self._url, self._access_key))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _get_async_session(self):
+        '''
+        Returns the aiohttp session for the running event loop, creating it on first
+        use. The connector is limited to `max_in_flight` open connections.
+
+        Returns:
+            - aiohttp.ClientSession: Session used for all requests
+        '''
+
+        if self._async_session is None or self._async_session.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_in_flight)
+            self._async_session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+
+        return self._async_session
+
+    async def close(self):
+        '''
+        Closes the aiohttp session and any open connections to the stack.
+        '''
+
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+    async def request(self, method, path, query={}, headers={}, body={}, base_url=None, cache=False):
+        '''
+        Issues a request to Onshape. At most `max_in_flight` requests are awaited
+        at once; the rest wait for a free slot.
+
+        Args:
+            - method (str): HTTP method
+            - path (str): Path  e.g. /api/documents/:id
+            - query (dict, default={}): Query params in key-value pairs
+            - headers (dict, default={}): Key-value pairs of headers
+            - body (dict, default={}): Body for POST request
+            - base_url (str, default=None): Host, including scheme and port (if different from creds file)
+            - cache (bool, default=False): Ignored; the response cache is only used by `Onshape`
+
+        Returns:
+            - aiohttp.ClientResponse: Response from Onshape, with the body already read
+        '''
+
+        session = self._get_async_session()
+        req_headers = self._make_headers(method, path, query, headers)
+        if base_url is None:
+            base_url = self._url
+        url = base_url + path + '?' + urlparse.urlencode(query)
+
+        if self._logging:
+            utils.log('request body: %s', body)
+            utils.log('request headers: %s', req_headers)
+            utils.log('request url: %s', url)
+
+        # only parse as json string if we have to
+        body = json.dumps(body) if isinstance(body, dict) else body
+
+        async with self._semaphore:
+            res = await session.request(method.upper(), url, headers=req_headers, data=body, allow_redirects=False)
+            try:
+                await res.read()
+            finally:
+                res.release()
+
+        if res.status == 307:
+            location = urlparse.urlparse(res.headers["Location"])
+            querystring = parse_qs(location.query)
+
+            if self._logging:
+                utils.log('request redirected to: ' + location.geturl())
+
+            new_query = {}
+            new_base_url = location.scheme + '://' + location.netloc
+
+            for key in querystring:
+                new_query[key] = querystring[key][0]  # won't work for repeated query params
+
+            return await self.request(method, location.path, query=new_query, headers=headers, base_url=new_base_url)
+        elif not 200 <= res.status <= 206:
+            if self._logging:
+                utils.log('request failed, details: ' + await res.text(), level=1)
+        else:
+            if self._logging:
+                utils.log('request succeeded, status: %d' % res.status)
+
+        return res
+
+
+class AsyncClient(Client):
+    '''
+    Asynchronous version of `Client`. Every endpoint method of `Client` is
+    available and returns an awaitable resolving to the response, e.g.
+
+        async with AsyncClient(creds='./creds.json') as client:
+            responses = await asyncio.gather(*[client.get_mass_properties(did, wid, eid, p) for p in parts])
+
+    Helpers that read responses before returning (e.g. `add_features`,
+    `get_face_ids`) are awaitable as well. Helpers that stream responses or
+    uploads (`export_stl`, `get_tessellated_edges`, `upload_blob`,
+    `upload_blobs`) are only supported by `Client`, and raise a TypeError.
+
+    Attributes:
+        - stack (str, default='https://cad.onshape.com'): Base URL
+        - logging (bool, default=False): Turn logging on or off
+        - max_in_flight (int, default=100): Maximum number of concurrent requests
+    '''
+
+    def __init__(self, stack='https://cad.onshape.com', creds: str='./cred.json', logging=False, max_in_flight: int=100):
+        '''
+        Instantiates a new asynchronous Onshape client.
+
+        Args:
+            - stack (str, default='https://cad.onshape.com'): Base URL
+            - logging (bool, default=False): Turn logging on or off
+            - max_in_flight (int, default=100): Maximum number of concurrent requests
+        '''
+
+        self._stack = stack
+        self._api = AsyncOnshape(stack=stack, creds=creds, logging=logging, max_in_flight=max_in_flight)
+        self._init_caches()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        '''
+        Closes the connections held open to the stack.
+        '''
+
+        await self._api.close()
+
+    def _sync_only(self, name):
+        raise TypeError('%s streams its data, which AsyncClient does not support; use Client.%s' % (name, name))
+
+    def upload_blob(self, did, wid, filepath='./blob.json'):
+        '''Not supported: the upload is streamed from disk. Use `Client.upload_blob`.'''
+        self._sync_only('upload_blob')
+
+    def upload_blobs(self, did, wid, filepaths: list, max_workers: int=4):
+        '''Not supported: the uploads are streamed from disk. Use `Client.upload_blobs`.'''
+        self._sync_only('upload_blobs')
+
+    def export_stl(self, did, wid, eid, file_path, wvm='w', chunk_size=1 << 20):
+        '''Not supported: the export is streamed to the file. Use `Client.export_stl`.'''
+        self._sync_only('export_stl')
+
+    def get_tessellated_edges(self, did, wid, eid, part_ids: list=None, wvm='w'):
+        '''Not supported: the response is parsed as it streams in. Use `Client.get_tessellated_edges`.'''
+        self._sync_only('get_tessellated_edges')
+
+    async def get_microversion(self, did, wid):
+        '''
+        Gets the current microversion of a workspace, as `Client.get_microversion`.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+
+        Returns:
+            - str: ID of the current microversion
+        '''
+        edits = self._known_microversion(did, wid)[1]
+        res = await self._microversion_request(did, wid)
+        res.raise_for_status()
+        microversion = (await res.json())['microversion']
+        self._note_microversion(did, wid, microversion, edits)
+        return microversion
+
+    async def get_face_ids(self, did, wid, eid, feature_ids: list, microversion: str=None):
+        '''
+        Gets the deterministic ids of the faces created by each of the given features,
+        as `Client.get_face_ids`, sharing its cache.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - feature_ids (list): IDs of features (or default planes, e.g. 'Front')
+            - microversion (str, default=None): Current microversion of the document, if known
+
+        Returns:
+            - dict: Lists of face ids, keyed by feature id
+        '''
+        element = (did, wid, eid)
+        known, edits = self._known_microversion(did, wid)
+        if microversion is None:
+            microversion = known
+
+        face_ids, missing = self._cached_face_ids(element, microversion, feature_ids)
+        if len(missing) > 0:
+            res = await self.execute_feature_script(did, wid, eid, self._face_ids_script(missing))
+            res.raise_for_status()
+            self._store_face_ids(element, edits, missing, await res.json(), face_ids)
+
+        return face_ids
+
+    async def add_features(self, did, wid, eid, calls: list):
+        '''
+        Adds an ordered list of features to the part studio, one after the other,
+        as `Client.add_features`.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - calls (list): Feature definitions (dict or JSON str), in insertion order
+
+        Returns:
+            - list: featureIds assigned to each call, in the same order
+        '''
+        bodies = [json.dumps(call) if isinstance(call, dict) else call for call in calls]
+        feature_ids = []
+        for body in bodies:
+            res = await self.add_feature(did, wid, eid, self._resolve_refs(body, feature_ids))
+            res.raise_for_status()
+            feature_ids.append((await res.json())['feature']['featureId'])
+        return feature_ids
+
+    async def upsert_feature(self, did, wid, eid, body, ledger):
+        '''
+        Pushes a named feature only as far as it changed since it was last pushed,
+        as `Client.upsert_feature`.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - body (dict or str): Feature definition call; features are identified by `feature.name`
+            - ledger (FeatureLedger): Record of the features pushed to the part studio
+
+        Returns:
+            - str: featureId of the feature
+        '''
+        name, digest = self._feature_identity(body)
+
+        entry = ledger.get(did, wid, eid, name)
+        if entry is not None:
+            feature_id, pushed_digest = entry
+            if pushed_digest == digest:
+                return feature_id
+            res = await self.update_feature(did, wid, eid, feature_id, body)
+            if res.status != 404:
+                res.raise_for_status()
+                ledger.record(did, wid, eid, name, feature_id, digest)
+                return feature_id
+
+        res = await self.add_feature(did, wid, eid, body if isinstance(body, str) else json.dumps(body))
+        res.raise_for_status()
+        feature_id = (await res.json())['feature']['featureId']
+        ledger.record(did, wid, eid, name, feature_id, digest)
+        return feature_id
+
+    async def get_partstudio_mass_properties(self, did, wid, eid, wvm='w'):
+        '''
+        Gets the mass properties of every part in a part studio with a single request,
+        as `Client.get_partstudio_mass_properties`.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID (or version / microversion ID, see `wvm`)
+            - eid (str): Element ID
+            - wvm (str, default='w'): 'w' for a workspace, 'v' for a version, 'm' for a microversion
+
+        Returns:
+            - geometry.MassPropertiesTable: Mass, centroid, inertia and principal axes of each part
+        '''
+
+        from onshape_api import geometry  # numpy is only imported when needed
+
+        res = await self._partstudio_mass_properties_request(did, wid, eid, wvm)
+        res.raise_for_status()
+        return geometry.parse_mass_properties(await res.json())
+
+    async def get_cached_mass_properties(self, did, wid, eid, part_id, microversion: str=None):
+        '''
+        Gets the mass properties for a part, as `Client.get_cached_mass_properties`,
+        sharing its cache.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - part_id (str): ID of part
+            - microversion (str, default=None): Microversion of the part studio, if known
+
+        Returns:
+            - dict: Parsed mass properties response
+        '''
+        key = self._mass_properties_key(did, wid, eid, part_id, microversion)
+
+        mass_properties = self._mass_properties.get(key)
+        if mass_properties is None:
+            res = await self.get_mass_properties(did, wid, eid, part_id)
+            res.raise_for_status()
+            mass_properties = await res.json()
+            self._mass_properties.put(key, mass_properties)
+
+        return mass_properties
@@ -0,0 +1,332 @@
+'''
+cache
+=====
+
+Caches for responses from the Onshape API
+'''
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+__all__ = [
+    'MicroversionCache',
+    'LRUCache',
+    'ResponseCache'
+]
+
+
+class MicroversionCache():
+    '''
+    Values cached per part studio, valid only for a single microversion. Storing
+    or looking up a value under a new microversion drops everything cached for
+    the old one. Safe to share between threads.
+    '''
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _values(self, element, microversion):
+        '''
+        Returns the values cached for the element at the given microversion,
+        dropping any values cached for a different microversion.
+        '''
+
+        cached = self._entries.get(element)
+        if cached is None or cached[0] != microversion:
+            cached = (microversion, {})
+            self._entries[element] = cached
+        return cached[1]
+
+    def get(self, element, microversion, key, default=None):
+        '''
+        Gets a cached value.
+
+        Args:
+            - element (tuple): (did, wid, eid) of the part studio
+            - microversion (str): Microversion the value must belong to
+            - key (hashable): Key of the value
+            - default (any, default=None): Returned if no value is cached
+
+        Returns:
+            - any: The cached value, or `default`
+        '''
+
+        with self._lock:
+            return self._values(element, microversion).get(key, default)
+
+    def put(self, element, microversion, key, value):
+        '''
+        Caches a value.
+
+        Args:
+            - element (tuple): (did, wid, eid) of the part studio
+            - microversion (str): Microversion the value belongs to
+            - key (hashable): Key of the value
+            - value (any): Value to cache
+        '''
+
+        with self._lock:
+            self._values(element, microversion)[key] = value
+
+    def invalidate(self, element):
+        '''
+        Drops every value cached for the part studio.
+
+        Args:
+            - element (tuple): (did, wid, eid) of the part studio
+        '''
+
+        with self._lock:
+            self._entries.pop(element, None)
+
+
+class LRUCache():
+    '''
+    Bounded mapping that evicts the least recently used entry once full. Safe to
+    share between threads.
+
+    Attributes:
+        - maxsize (int, default=128): Maximum number of entries kept
+    '''
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        '''
+        Gets a cached value, marking it as most recently used.
+
+        Args:
+            - key (hashable): Key of the value
+            - default (any, default=None): Returned if no value is cached
+
+        Returns:
+            - any: The cached value, or `default`
+        '''
+
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        '''
+        Caches a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            - key (hashable): Key of the value
+            - value (any): Value to cache
+        '''
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, match=None):
+        '''
+        Drops cached entries.
+
+        Args:
+            - match (callable, default=None): Drops only the keys for which `match(key)`
+              is True; drops everything if None
+        '''
+
+        with self._lock:
+            if match is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if match(key)]:
+                del self._entries[key]
+
+
+class ResponseCache():
+    '''
+    Size-bounded store of GET response bodies on disk. Responses for a fixed
+    version or microversion (paths containing `/v/` or `/m/`) never change and are
+    served straight from disk; responses for a workspace are revalidated with
+    If-None-Match when the server sent an ETag, and not stored otherwise. The least
+    recently used entries are evicted once the store grows past `max_bytes`.
+
+    Attributes:
+        - directory (str): Folder to keep cached responses in
+        - max_bytes (int, default=1 GB): Maximum total size of cached bodies
+    '''
+
+    chunk_size = 1 << 16
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                meta_path = os.path.join(directory, filename)
+                try:
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                entries.append((os.path.getmtime(meta_path), filename[:-5], meta['size']))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+
+    @staticmethod
+    def key(url, accept=None):
+        '''
+        Makes the cache key for a request.
+
+        Args:
+            - url (str): Full request URL, including the query string
+            - accept (str, default=None): Accept header of the request
+
+        Returns:
+            - str: Key identifying the request
+        '''
+
+        return hashlib.sha256(('%s\n%s' % (url, accept)).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_immutable(path):
+        '''
+        Whether the path refers to a version or microversion, so that its response
+        can never change.
+        '''
+
+        return re.search(r'/d/[^/]+/[vm]/', path) is not None
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.body', base + '.json'
+
+    @property
+    def size(self):
+        '''Total size in bytes of the cached bodies.'''
+        with self._lock:
+            return sum(self._index.values())
+
+    def get(self, key):
+        '''
+        Looks up a cached response, marking it as most recently used.
+
+        Args:
+            - key (str): Key from `ResponseCache.key`
+
+        Returns:
+            - tuple: (meta (dict), body path (str)), or None if not cached
+        '''
+
+        body_path, meta_path = self._paths(key)
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            self.discard(key)
+            return None
+        return meta, body_path
+
+    def put(self, key, chunks, status, headers, immutable=False):
+        '''
+        Writes a response body to disk chunk by chunk, then evicts old entries to
+        stay within `max_bytes`.
+
+        Args:
+            - key (str): Key from `ResponseCache.key`
+            - chunks (iterable): Body of the response, as bytes
+            - status (int): HTTP status code
+            - headers (dict): Response headers to keep (e.g. ETag, Content-Type)
+            - immutable (bool, default=False): Whether the response can never change
+
+        Returns:
+            - tuple: (meta (dict), body path (str)) of the new entry
+        '''
+
+        body_path, meta_path = self._paths(key)
+        tmp_path = '%s.%d.%d.tmp' % (body_path, os.getpid(), threading.get_ident())
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, body_path)
+
+        meta = {
+            'status': status,
+            'headers': headers,
+            'etag': headers.get('ETag'),
+            'immutable': immutable,
+            'size': size,
+            'stored': time.time()
+        }
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+        with self._lock:
+            self._index[key] = size
+            self._index.move_to_end(key)
+            total = sum(self._index.values())
+            evicted = []
+            while total > self.max_bytes and len(self._index) > 1:
+                old_key, old_size = self._index.popitem(last=False)
+                total -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._remove_files(old_key)
+
+        return meta, body_path
+
+    def discard(self, key):
+        '''
+        Removes a response from the cache.
+
+        Args:
+            - key (str): Key from `ResponseCache.key`
+        '''
+
+        with self._lock:
+            self._index.pop(key, None)
+        self._remove_files(key)
+
+    def clear(self):
+        '''
+        Removes every response from the cache.
+        '''
+
+        with self._lock:
+            keys = list(self._index)
+            self._index.clear()
+        for key in keys:
+            self._remove_files(key)
+
+    def _remove_files(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -6,12 +6,37 @@ Convenience functions for working with the Onshape API
 '''
 
 from onshape_api.onshape import Onshape
+from onshape_api.cache import MicroversionCache, LRUCache
+from onshape_api.multipart import MultipartEncoder
+from onshape_api.ledger import feature_digest
 
 import mimetypes
-import random
-import string
 import os
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = [
+    'DocumentIDs',
+    'Client',
+    'feature_ref'
+]
+
+
+def feature_ref(index):
+    '''
+    Placeholder for the featureId of an earlier feature in a call to
+    `Client.add_features`. The placeholder is replaced by the assigned id before
+    the referring feature is sent.
+
+    Args:
+        - index (int): Position of the referenced feature in the batch
+
+    Returns:
+        - str: Placeholder to use in place of the featureId
+    '''
+
+    return '$feature[%d]' % index
 
 
 class DocumentIDs():
@@ -65,19 +90,106 @@ class Client():
     Attributes:
         - stack (str, default='https://cad.onshape.com'): Base URL
         - logging (bool, default=True): Turn logging on or off
+        - pool_size (int, default=10): Maximum number of keep-alive connections to the stack
+        - mass_cache_size (int, default=128): Number of parts to keep mass properties for
+        - cache_dir (str, default=None): Folder for caching read-only responses on disk; no caching if None
+        - cache_size (int, default=1 GB): Maximum size in bytes of the on-disk response cache
+        - tracer (utils.RequestTracer, default=None): Collects a record of every request
+        - transport (transport, default=None): Sends the signed requests, e.g. a `transport.ReplayTransport`
+        - scheduler (scheduler.RequestScheduler, default=None): Rate limits and retries requests; shared per stack if None
     '''
 
-    def __init__(self, stack='https://cad.onshape.com', creds: str='./cred.json', logging=False):
+    def __init__(self, stack='https://cad.onshape.com', creds: str='./cred.json', logging=False, pool_size: int=10,
+                 mass_cache_size: int=128, cache_dir: str=None, cache_size: int=1 << 30, tracer=None, transport=None,
+                 scheduler=None):
         '''
         Instantiates a new Onshape client.
 
         Args:
             - stack (str, default='https://cad.onshape.com'): Base URL
             - logging (bool, default=True): Turn logging on or off
+            - pool_size (int, default=10): Maximum number of keep-alive connections to the stack
+            - mass_cache_size (int, default=128): Number of parts to keep mass properties for
+            - cache_dir (str, default=None): Folder for caching read-only responses on disk; no caching if None
+            - cache_size (int, default=1 GB): Maximum size in bytes of the on-disk response cache
+            - tracer (utils.RequestTracer, default=None): Collects a record of every request
+            - transport (transport, default=None): Sends the signed requests, e.g. a `transport.ReplayTransport`
+            - scheduler (scheduler.RequestScheduler, default=None): Rate limits and retries requests; shared per stack if None
         '''
 
         self._stack = stack
-        self._api = Onshape(stack=stack, creds=creds, logging=logging)
+        self._api = Onshape(stack=stack, creds=creds, logging=logging, pool_size=pool_size,
+                            cache_dir=cache_dir, cache_size=cache_size, tracer=tracer, transport=transport,
+                            scheduler=scheduler)
+        self._init_caches(mass_cache_size)
+
+    def _init_caches(self, mass_cache_size=128):
+        '''
+        Sets up the in-memory caches kept for each part studio.
+        '''
+
+        self._edits = {}
+        self._edits_lock = threading.Lock()
+        self._document_edits = {}
+        self._microversions = {}
+        self._face_ids = MicroversionCache()
+        self._mass_properties = LRUCache(maxsize=mass_cache_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        Closes the connections held open to the stack.
+        '''
+
+        self._api.close()
+
+    def _local_microversion(self, did, wid, eid):
+        '''
+        Returns a stand-in for the microversion of the part studio: the number of
+        edits this client has made to it. Used to key caches when the caller does not
+        know the server microversion; edits made by other clients are not seen.
+        '''
+
+        return 'local-%d' % self._edits.get((did, wid, eid), 0)
+
+    def _record_edit(self, did, wid, eid):
+        '''
+        Notes that this client changed the part studio, so cached values for it are stale.
+        '''
+
+        element = (did, wid, eid)
+        with self._edits_lock:
+            self._edits[element] = self._edits.get(element, 0) + 1
+            self._document_edits[(did, wid)] = self._document_edits.get((did, wid), 0) + 1
+            self._microversions.pop((did, wid), None)
+        self._face_ids.invalidate(element)
+        self._mass_properties.invalidate(lambda key: (key[0], key[2], key[3]) == element)
+
+    def _known_microversion(self, did, wid):
+        '''
+        Returns the microversion of the workspace as last reported by the server, or
+        None if this client changed the workspace since, together with the number
+        of edits this client has made to it (to pass to `_note_microversion`).
+        '''
+
+        with self._edits_lock:
+            return self._microversions.get((did, wid)), self._document_edits.get((did, wid), 0)
+
+    def _note_microversion(self, did, wid, microversion, edits):
+        '''
+        Notes the microversion of the workspace reported by a response, unless this
+        client changed the workspace after `_known_microversion` returned `edits`,
+        as the microversion has moved on since.
+        '''
+
+        with self._edits_lock:
+            if self._document_edits.get((did, wid), 0) == edits:
+                self._microversions[(did, wid)] = microversion
 
     def new_document(self, name='Test Document', owner_type=0, public=False):
         '''
@@ -142,7 +254,7 @@ class Client():
             - requests.Response: Onshape response data
         '''
 
-        return self._api.request('get', '/api/documents/' + did)
+        return self._api.request('get', '/api/documents/' + did, cache=True)
 
     def list_documents(self):
         '''
@@ -152,7 +264,7 @@ class Client():
             - requests.Response: Onshape response data
         '''
 
-        return self._api.request('get', '/api/documents')
+        return self._api.request('get', '/api/documents', cache=True)
 
     def create_assembly(self, did, wid, name='My Assembly'):
         '''
@@ -173,39 +285,85 @@ class Client():
 
         return self._api.request('post', '/api/assemblies/d/' + did + '/w/' + wid, body=payload)
 
-    def get_features(self, did, wid, eid):
+    def create_partstudio(self, did, wid, name='Part Studio'):
         '''
-        Gets the feature list for specified document / workspace / part studio.
+        Creates a new part studio element in the specified document / workspace.
 
         Args:
             - did (str): Document ID
             - wid (str): Workspace ID
+            - name (str, default='Part Studio')
+
+        Returns:
+            - requests.Response: Onshape response data, with the new element ID as `id`
+        '''
+
+        payload = {
+            'name': name
+        }
+
+        return self._api.request('post', '/api/partstudios/d/' + did + '/w/' + wid, body=payload)
+
+    def get_features(self, did, wid, eid, wvm='w'):
+        '''
+        Gets the feature list for specified document / workspace / part studio.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID (or version / microversion ID, see `wvm`)
             - eid (str): Element ID
+            - wvm (str, default='w'): 'w' for a workspace, 'v' for a version, 'm' for a microversion
 
         Returns:
             - requests.Response: Onshape response data
         '''
 
-        return self._api.request('get', '/api/partstudios/d/' + did + '/w/' + wid + '/e/' + eid + '/features')
+        return self._api.request('get', '/api/partstudios/d/' + did + '/' + wvm + '/' + wid + '/e/' + eid + '/features', cache=True)
 
-    def get_partstudio_tessellatededges(self, did, wid, eid):
+    def get_partstudio_tessellatededges(self, did, wid, eid, wvm='w'):
         '''
         Gets the tessellation of the edges of all parts in a part studio.
 
         Args:
             - did (str): Document ID
-            - wid (str): Workspace ID
+            - wid (str): Workspace ID (or version / microversion ID, see `wvm`)
             - eid (str): Element ID
+            - wvm (str, default='w'): 'w' for a workspace, 'v' for a version, 'm' for a microversion
 
         Returns:
             - requests.Response: Onshape response data
         '''
 
-        return self._api.request('get', '/api/partstudios/d/' + did + '/w/' + wid + '/e/' + eid + '/tessellatededges')
+        return self._api.request('get', '/api/partstudios/d/' + did + '/' + wvm + '/' + wid + '/e/' + eid + '/tessellatededges', cache=True)
+
+    def get_tessellated_edges(self, did, wid, eid, part_ids: list=None, wvm='w'):
+        '''
+        Gets the tessellation of the edges of the parts in a part studio as arrays,
+        parsing the response as it streams in.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID (or version / microversion ID, see `wvm`)
+            - eid (str): Element ID
+            - part_ids (list, default=None): Only keep the edges of these parts
+            - wvm (str, default='w'): 'w' for a workspace, 'v' for a version, 'm' for a microversion
+
+        Returns:
+            - geometry.TessellatedEdges: Vertices, edge offsets and part / edge ids
+        '''
+
+        from onshape_api import geometry  # numpy is only imported when needed
+
+        res = self.get_partstudio_tessellatededges(did, wid, eid, wvm=wvm)
+        try:
+            return geometry.parse_tessellated_edges(res, part_ids=part_ids)
+        finally:
+            res.close()
 
     def upload_blob(self, did, wid, filepath='./blob.json'):
         '''
-        Uploads a file to a new blob element in the specified doc.
+        Uploads a file to a new blob element in the specified doc. The file is read
+        in binary mode and streamed from disk as it is sent.
 
         Args:
             - did (str): Document ID
@@ -216,36 +374,51 @@ class Client():
             - requests.Response: Onshape response data
         '''
 
-        chars = string.ascii_letters + string.digits
-        boundary_key = ''.join(random.choice(chars) for i in range(8))
-
-        mimetype = mimetypes.guess_type(filepath)[0]
+        mimetype = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
         encoded_filename = os.path.basename(filepath)
         file_content_length = str(os.path.getsize(filepath))
-        blob = open(filepath)
 
+        payload = MultipartEncoder(
+            fields=[('encodedFilename', encoded_filename), ('fileContentLength', file_content_length)],
+            files=[('file', filepath, mimetype)]
+        )
         req_headers = {
-            'Content-Type': 'multipart/form-data; boundary="%s"' % boundary_key
+            'Content-Type': payload.content_type
         }
 
-        # build request body
-        payload = '--' + boundary_key + '\r\nContent-Disposition: form-data; name="encodedFilename"\r\n\r\n' + encoded_filename + '\r\n'
-        payload += '--' + boundary_key + '\r\nContent-Disposition: form-data; name="fileContentLength"\r\n\r\n' + file_content_length + '\r\n'
-        payload += '--' + boundary_key + '\r\nContent-Disposition: form-data; name="file"; filename="' + encoded_filename + '"\r\n'
-        payload += 'Content-Type: ' + mimetype + '\r\n\r\n'
-        payload += blob.read()
-        payload += '\r\n--' + boundary_key + '--'
+        try:
+            return self._api.request('post', '/api/blobelements/d/' + did + '/w/' + wid, headers=req_headers, body=payload)
+        finally:
+            payload.close()
+
+    def upload_blobs(self, did, wid, filepaths: list, max_workers: int=4):
+        '''
+        Uploads several files to new blob elements at once, each over its own
+        connection from the pool.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - filepaths (list): Locations of the files to upload
+            - max_workers (int, default=4): Maximum number of concurrent uploads
+
+        Returns:
+            - list: requests.Response for each file, in the same order
+        '''
 
-        return self._api.request('post', '/api/blobelements/d/' + did + '/w/' + wid, headers=req_headers, body=payload)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda filepath: self.upload_blob(did, wid, filepath), filepaths))
 
-    def part_studio_stl(self, did, wid, eid):
+    def part_studio_stl(self, did, wid, eid, wvm='w', mode=None):
         '''
         Exports STL export from a part studio
 
         Args:
             - did (str): Document ID
-            - wid (str): Workspace ID
+            - wid (str): Workspace ID (or version / microversion ID, see `wvm`)
             - eid (str): Element ID
+            - wvm (str, default='w'): 'w' for a workspace, 'v' for a version, 'm' for a microversion
+            - mode (str, default=None): 'text' or 'binary'; Onshape exports text if not given
 
         Returns:
             - requests.Response: Onshape response data
@@ -254,7 +427,38 @@ class Client():
         req_headers = {
             'Accept': 'application/vnd.onshape.v1+octet-stream'
         }
-        return self._api.request('get', '/api/partstudios/d/' + did + '/w/' + wid + '/e/' + eid + '/stl', headers=req_headers)
+        query = {} if mode is None else {'mode': mode}
+        return self._api.request('get', '/api/partstudios/d/' + did + '/' + wvm + '/' + wid + '/e/' + eid + '/stl', query=query, headers=req_headers, cache=True)
+
+    def export_stl(self, did, wid, eid, file_path, wvm='w', chunk_size=1 << 20):
+        '''
+        Exports a binary STL of a part studio straight to a file, writing the response
+        in chunks so the export is never held in memory. Binary STLs are about a fifth
+        the size of text ones, and are memory-mapped by `geometry.load_stl`.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID (or version / microversion ID, see `wvm`)
+            - eid (str): Element ID
+            - file_path (str): Location of the STL file to write
+            - wvm (str, default='w'): 'w' for a workspace, 'v' for a version, 'm' for a microversion
+            - chunk_size (int, default=1 MB): Bytes read from the response at a time
+
+        Returns:
+            - int: Number of bytes written
+        '''
+
+        res = self.part_studio_stl(did, wid, eid, wvm=wvm, mode='binary')
+        try:
+            res.raise_for_status()
+            written = 0
+            with open(file_path, 'wb') as f:
+                for chunk in res.iter_content(chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+        finally:
+            res.close()
+        return written
 
     def execute_feature_script(self, did, wid, eid, feature_script: str=None, file_path: str=None):
         '''
@@ -281,6 +485,112 @@ class Client():
         api_url = f"/api/partstudios/d/{did}/w/{wid}/e/{eid}/featurescript"
         return self._api.request('post', api_url, body=payload)
     
+    def get_microversion(self, did, wid):
+        '''
+        Gets the current microversion of a workspace. Pass it as `wid` with `wvm='m'` to
+        read-only endpoints to get responses that can be cached without revalidation.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+
+        Returns:
+            - str: ID of the current microversion
+        '''
+        edits = self._known_microversion(did, wid)[1]
+        res = self._microversion_request(did, wid)
+        res.raise_for_status()
+        microversion = res.json()['microversion']
+        self._note_microversion(did, wid, microversion, edits)
+        return microversion
+
+    def _microversion_request(self, did, wid):
+        '''
+        Requests the current microversion of a workspace; shared with `AsyncClient`.
+        '''
+        api_url = f"/api/documents/d/{did}/w/{wid}/currentmicroversion"
+        return self._api.request('get', api_url)
+
+    def get_face_ids(self, did, wid, eid, feature_ids: list, microversion: str=None):
+        '''
+        Gets the deterministic ids of the faces created by each of the given features,
+        using a single feature script. Results are cached under the microversion of
+        the document the script was evaluated at, so a feature is only queried once
+        until the document changes.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - feature_ids (list): IDs of features (or default planes, e.g. 'Front')
+            - microversion (str, default=None): Current microversion of the document, if known;
+              otherwise the one last reported by the server, unless this client edited the document
+              since, in which case every feature is queried
+
+        Returns:
+            - dict: Lists of face ids, keyed by feature id
+        '''
+        element = (did, wid, eid)
+        known, edits = self._known_microversion(did, wid)
+        if microversion is None:
+            microversion = known
+
+        face_ids, missing = self._cached_face_ids(element, microversion, feature_ids)
+        if len(missing) > 0:
+            res = self.execute_feature_script(did, wid, eid, self._face_ids_script(missing))
+            res.raise_for_status()
+            self._store_face_ids(element, edits, missing, res.json(), face_ids)
+
+        return face_ids
+
+    def _cached_face_ids(self, element, microversion, feature_ids):
+        '''
+        Looks up the face ids of features in the cache, at the microversion of the
+        document (nothing is cached if it is not known).
+
+        Returns:
+            - tuple: Cached lists of face ids keyed by feature id, and the feature ids that were not cached
+        '''
+        if microversion is None:
+            return {}, list(feature_ids)
+
+        face_ids = {}
+        missing = []
+        for feature_id in feature_ids:
+            cached = self._face_ids.get(element, microversion, feature_id)
+            if cached is None:
+                missing.append(feature_id)
+            else:
+                face_ids[feature_id] = cached
+        return face_ids, missing
+
+    @staticmethod
+    def _face_ids_script(feature_ids):
+        '''
+        Feature script returning the face ids created by each of the features, in order.
+        '''
+        queried = json.dumps(feature_ids)
+        return ('function(context is Context, queries) { var out = []; '
+                f'for (var id in {queried}) {{ '
+                'out = append(out, transientQueriesToStrings(evaluateQuery(context, qCreatedBy(makeId(id), EntityType.FACE)))); '
+                '} return out; }')
+
+    def _store_face_ids(self, element, edits, feature_ids, payload, face_ids):
+        '''
+        Adds the face ids returned by `_face_ids_script` for the features to `face_ids`, and
+        caches them under the microversion the script was evaluated at, which is noted as
+        the current one (see `_note_microversion`).
+        '''
+        microversion = payload.get('sourceMicroversion')
+        results = payload['result']['message']['value']
+        for feature_id, result in zip(feature_ids, results):
+            faces = [face['message']['value'] for face in result['message']['value']]
+            if microversion is not None:
+                self._face_ids.put(element, microversion, feature_id, faces)
+            face_ids[feature_id] = faces
+        if microversion is not None:
+            self._note_microversion(element[0], element[1], microversion, edits)
+
     def add_feature(self, did, wid, eid, body: str=None, file_path: str=None):
         '''
         Executes the feature script.
@@ -300,8 +610,121 @@ class Client():
                 body = file.read()
 
         api_url = f"/api/v9/partstudios/d/{did}/w/{wid}/e/{eid}/features"
+        self._record_edit(did, wid, eid)
         return self._api.request('post', api_url, body=body)
     
+    def add_features(self, did, wid, eid, calls: list):
+        '''
+        Adds an ordered list of features to the part studio. A feature may refer to
+        an earlier feature in the list with `feature_ref(i)` wherever the featureId
+        of feature `i` is needed (e.g. an extrude of a sketch in the same batch).
+
+        Each body is serialized once and only the placeholders are substituted, so
+        the features are sent back-to-back over the pooled connection without any
+        work between requests. The REST API has no multi-feature insert, so this is
+        one request per feature.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - calls (list): Feature definitions (dict or JSON str), in insertion order
+
+        Returns:
+            - list: featureIds assigned to each call, in the same order
+        '''
+        bodies = [json.dumps(call) if isinstance(call, dict) else call for call in calls]
+        feature_ids = []
+        for body in bodies:
+            res = self.add_feature(did, wid, eid, self._resolve_refs(body, feature_ids))
+            res.raise_for_status()
+            feature_ids.append(res.json()['feature']['featureId'])
+        return feature_ids
+
+    @staticmethod
+    def _resolve_refs(body, feature_ids):
+        '''
+        Replaces the `feature_ref` placeholders in a serialized feature by the featureIds assigned so far.
+        '''
+        for i, feature_id in enumerate(feature_ids):
+            ref = feature_ref(i)
+            if ref in body:
+                body = body.replace(ref, feature_id)
+        return body
+
+    def update_feature(self, did, wid, eid, feature_id, body):
+        '''
+        Replaces the definition of an existing feature, keeping its featureId.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - feature_id (str): ID of feature
+            - body (dict or str): New feature definition call
+
+        Returns:
+            - requests.Response: Onshape response data
+        '''
+        call = json.loads(body) if isinstance(body, str) else dict(body)
+        call['feature'] = dict(call['feature'], featureId=feature_id)
+
+        api_url = f"/api/v9/partstudios/d/{did}/w/{wid}/e/{eid}/features/featureid/{feature_id}"
+        self._record_edit(did, wid, eid)
+        return self._api.request('post', api_url, body=call)
+
+    def upsert_feature(self, did, wid, eid, body, ledger):
+        '''
+        Pushes a named feature only as far as it changed since it was last pushed:
+        unchanged features are not sent at all, changed features are updated in
+        place, and new features (or ones deleted from the part studio since) are added.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - body (dict or str): Feature definition call; features are identified by `feature.name`.
+              Serialized bodies may carry `name` and `digest` attributes to save parsing them
+            - ledger (FeatureLedger): Record of the features pushed to the part studio
+
+        Returns:
+            - str: featureId of the feature
+        '''
+        name, digest = self._feature_identity(body)
+
+        entry = ledger.get(did, wid, eid, name)
+        if entry is not None:
+            feature_id, pushed_digest = entry
+            if pushed_digest == digest:
+                return feature_id
+            res = self.update_feature(did, wid, eid, feature_id, body)
+            if res.status_code != 404:
+                res.raise_for_status()
+                ledger.record(did, wid, eid, name, feature_id, digest)
+                return feature_id
+
+        res = self.add_feature(did, wid, eid, body if isinstance(body, str) else json.dumps(body))
+        res.raise_for_status()
+        feature_id = res.json()['feature']['featureId']
+        ledger.record(did, wid, eid, name, feature_id, digest)
+        return feature_id
+
+    @staticmethod
+    def _feature_identity(body):
+        '''
+        Name and digest of a feature definition call, taken from the attributes of a
+        serialized body if it carries them.
+
+        Returns:
+            - tuple: Name of the feature and digest of its definition
+        '''
+        name, digest = getattr(body, 'name', None), getattr(body, 'digest', None)
+        if name is None or digest is None:
+            call = json.loads(body) if isinstance(body, str) else body
+            name = call['feature']['name']
+            digest = feature_digest(call)
+        return name, digest
+
     def delete_feature(self, did, wid, eid, feature_id):
         '''
         Deletes the feature with the given feature Id.
@@ -316,6 +739,7 @@ class Client():
             - requests.Response: Onshape response data
         '''
         api_url = f"/api/v9/partstudios/d/{did}/w/{wid}/e/{eid}/features/featureid/{feature_id}"
+        self._record_edit(did, wid, eid)
         return self._api.request('delete', api_url)
     
     def get_mass_properties(self, did, wid, eid, part_id):
@@ -326,10 +750,73 @@ class Client():
             - did (str): Document ID
             - wid (str): Workspace ID
             - eid (str): Element ID
-            - feature_id (str): ID of feature
+            - part_id (str): ID of part
 
         Returns:
-            - requests.Response: Onshape response data
+            - requests.Response: Onshape response data, with the properties under `bodies[part_id]`
+        '''
+        api_url = f"/api/parts/d/{did}/w/{wid}/e/{eid}/partid/{part_id}/massproperties"
+        return self._api.request('get', api_url)
+
+    def get_partstudio_mass_properties(self, did, wid, eid, wvm='w'):
+        '''
+        Gets the mass properties of every part in a part studio with a single request,
+        as arrays indexed by part id.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID (or version / microversion ID, see `wvm`)
+            - eid (str): Element ID
+            - wvm (str, default='w'): 'w' for a workspace, 'v' for a version, 'm' for a microversion
+
+        Returns:
+            - geometry.MassPropertiesTable: Mass, centroid, inertia and principal axes of each part
+        '''
+
+        from onshape_api import geometry  # numpy is only imported when needed
+
+        res = self._partstudio_mass_properties_request(did, wid, eid, wvm)
+        res.raise_for_status()
+        return geometry.parse_mass_properties(res.json())
+
+    def _partstudio_mass_properties_request(self, did, wid, eid, wvm='w'):
+        '''
+        Requests the mass properties of every part in a part studio; shared with `AsyncClient`.
+        '''
+        api_url = f"/api/partstudios/d/{did}/{wvm}/{wid}/e/{eid}/massproperties"
+        return self._api.request('get', api_url, query={'massAsGroup': 'false'})
+
+    def get_cached_mass_properties(self, did, wid, eid, part_id, microversion: str=None):
+        '''
+        Gets the mass properties for a part, reusing the response from earlier calls
+        for the same part at the same microversion. Entries for a part studio are
+        dropped whenever this client adds or deletes a feature in it.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - part_id (str): ID of part
+            - microversion (str, default=None): Microversion of the part studio, if known
+
+        Returns:
+            - dict: Parsed mass properties response
+        '''
+        key = self._mass_properties_key(did, wid, eid, part_id, microversion)
+
+        mass_properties = self._mass_properties.get(key)
+        if mass_properties is None:
+            res = self.get_mass_properties(did, wid, eid, part_id)
+            res.raise_for_status()
+            mass_properties = res.json()
+            self._mass_properties.put(key, mass_properties)
+
+        return mass_properties
+
+    def _mass_properties_key(self, did, wid, eid, part_id, microversion=None):
+        '''
+        Key of the mass properties of a part in the cache.
         '''
-        api_url = f"/parts/d/{did}/w/{wid}/e/{eid}/partid/{part_id}/massproperties"
-        return self._api.request('get', api_url)
\ No newline at end of file
+        if microversion is None:
+            microversion = self._local_microversion(did, wid, eid)
+        return (did, 'w', wid, eid, part_id, microversion)
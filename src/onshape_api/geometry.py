@@ -0,0 +1,339 @@
+'''
+geometry
+========
+
+Loaders that turn geometry exported from Onshape into NumPy arrays
+'''
+
+import os
+import json
+import array
+import codecs
+
+import numpy as np
+
+__all__ = [
+    'STL_DTYPE',
+    'is_binary_stl',
+    'load_stl',
+    'TessellatedEdges',
+    'iter_json_array',
+    'parse_tessellated_edges',
+    'MassPropertiesTable',
+    'parse_mass_properties'
+]
+
+# One facet of a binary STL file: normal, three vertices and an attribute byte count (50 bytes)
+STL_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2')
+])
+STL_HEADER = 84
+
+
+def is_binary_stl(file_path):
+    '''
+    Checks whether an STL file is binary, by comparing its size to the facet count
+    in its header (ASCII files may also start with "solid", so that is not used).
+
+    Args:
+        - file_path (str): Location of the STL file
+
+    Returns:
+        - bool: True if the file is a binary STL
+    '''
+
+    size = os.path.getsize(file_path)
+    if size < STL_HEADER:
+        return False
+    with open(file_path, 'rb') as f:
+        f.seek(80)
+        count = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+    return size == STL_HEADER + count * STL_DTYPE.itemsize
+
+
+def load_stl(file_path, mmap=True):
+    '''
+    Loads the triangles and normals of an STL file. Binary files are memory-mapped
+    by default, so the arrays are views of the file on disk rather than copies in
+    memory.
+
+    Args:
+        - file_path (str): Location of the STL file
+        - mmap (bool, default=True): Memory-map binary files instead of reading them
+
+    Returns:
+        - tuple: (triangles (n, 3, 3) float32 array, normals (n, 3) float32 array)
+    '''
+
+    if is_binary_stl(file_path):
+        if mmap:
+            count = (os.path.getsize(file_path) - STL_HEADER) // STL_DTYPE.itemsize
+            if count == 0:
+                return np.zeros((0, 3, 3), dtype='<f4'), np.zeros((0, 3), dtype='<f4')
+            facets = np.memmap(file_path, dtype=STL_DTYPE, mode='r', offset=STL_HEADER, shape=(count,))
+        else:
+            facets = np.fromfile(file_path, dtype=STL_DTYPE, offset=STL_HEADER)
+        return facets['vertices'], facets['normal']
+
+    # ASCII files are read a line at a time into a compact float buffer: the normal and three vertices of each facet
+    values = array.array('f')
+    with open(file_path, 'r') as f:
+        for line in f:
+            words = line.split()
+            if len(words) == 5 and words[0] == 'facet':
+                values.extend(map(float, words[2:]))
+            elif len(words) == 4 and words[0] == 'vertex':
+                values.extend(map(float, words[1:]))
+    values = np.frombuffer(values, dtype=np.float32).astype('<f4', copy=False).reshape(-1, 12)
+    return values[:, 3:].reshape(-1, 3, 3), values[:, :3].copy()
+
+
+class TessellatedEdges():
+    '''
+    Tessellated edges of the parts in a part studio, stored as flat arrays: the
+    vertices of every edge concatenated, with offsets marking where each edge
+    starts.
+
+    Attributes:
+        - vertices (ndarray): (n, 3) vertices of all edges
+        - offsets (ndarray): (e + 1,) start of each edge in `vertices`; edge i is
+          `vertices[offsets[i]:offsets[i+1]]`
+        - edge_ids (list): Id of each edge
+        - edge_parts (ndarray): (e,) index into `part_ids` of the part owning each edge
+        - part_ids (list): Ids of the parts, in the order they were returned
+        - part_index (dict): (first edge, last edge + 1) of each part, keyed by part id
+    '''
+
+    def __init__(self, vertices, offsets, edge_ids, edge_parts, part_ids):
+        self.vertices = vertices
+        self.offsets = offsets
+        self.edge_ids = edge_ids
+        self.edge_parts = edge_parts
+        self.part_ids = part_ids
+        self.part_index = {}
+        bounds = np.searchsorted(edge_parts, np.arange(len(part_ids) + 1))
+        for i, part_id in enumerate(part_ids):
+            self.part_index[part_id] = (int(bounds[i]), int(bounds[i + 1]))
+        self._edge_index = None
+
+    def __len__(self):
+        return len(self.edge_ids)
+
+    def edge(self, edge):
+        '''
+        Gets the vertices of an edge.
+
+        Args:
+            - edge (int or str): Position or id of the edge
+
+        Returns:
+            - ndarray: (k, 3) view of the edge's vertices
+        '''
+
+        if isinstance(edge, str):
+            if self._edge_index is None:
+                self._edge_index = {edge_id: i for i, edge_id in enumerate(self.edge_ids)}
+            edge = self._edge_index[edge]
+        return self.vertices[self.offsets[edge]:self.offsets[edge + 1]]
+
+    def part(self, part_id):
+        '''
+        Gets the vertices of all edges of a part.
+
+        Args:
+            - part_id (str): Id of the part
+
+        Returns:
+            - tuple: ((k, 3) view of the part's vertices, offsets of its edges into that view)
+        '''
+
+        first, last = self.part_index[part_id]
+        start = self.offsets[first]
+        return self.vertices[start:self.offsets[last]], self.offsets[first:last + 1] - start
+
+
+def iter_json_array(chunks):
+    '''
+    Yields the elements (objects or arrays) of a top-level JSON array one at a time, decoding each as
+    soon as it has been read, so that only one element is held as Python objects.
+
+    Args:
+        - chunks (iterable): Bytes of the JSON document, e.g. `response.iter_content(...)`
+
+    Yields:
+        - any: Each decoded element of the array
+    '''
+
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    started = False
+    exhausted = False
+    retry_at = 0  # only retry a failed decode once the buffer has doubled, to stay linear
+
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError('expected a JSON array')
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            if len(buf) >= retry_at or exhausted:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if exhausted:
+                        raise
+                    retry_at = pos + 2 * (len(buf) - pos)
+                else:
+                    yield value
+                    buf = buf[end:]
+                    pos = 0
+                    retry_at = 0
+                    continue
+        if exhausted:
+            raise ValueError('unexpected end of JSON array')
+        chunk = next(chunks, None)
+        if chunk is None:
+            buf += text.decode(b'', final=True)
+            exhausted = True
+        else:
+            buf += text.decode(chunk)
+
+
+def parse_tessellated_edges(source, part_ids=None, chunk_size=1 << 16):
+    '''
+    Parses the response of `Client.get_partstudio_tessellatededges` into a
+    `TessellatedEdges`. The response is read incrementally one part at a time and
+    each edge is converted to an array straight away, so the full nested JSON is
+    never built.
+
+    Args:
+        - source (requests.Response, str or iterable): Response, path of a saved
+          response, or chunks of bytes
+        - part_ids (iterable, default=None): Only keep the edges of these parts
+        - chunk_size (int, default=64 kB): Bytes read at a time
+
+    Returns:
+        - TessellatedEdges: Edges of the (selected) parts
+    '''
+
+    if hasattr(source, 'iter_content'):
+        source.raise_for_status()
+        chunks = source.iter_content(chunk_size)
+    elif isinstance(source, str):
+        def read_file(file_path):
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    yield chunk
+        chunks = read_file(source)
+    else:
+        chunks = source
+    wanted = None if part_ids is None else set(part_ids)
+
+    arrays, lengths, edge_ids, edge_parts, found_parts = [], [], [], [], []
+    for part in iter_json_array(chunks):
+        if wanted is not None and part['partId'] not in wanted:
+            continue
+        index = len(found_parts)
+        found_parts.append(part['partId'])
+        for edge in part.get('edges', []):
+            vertices = np.asarray(edge['vertices'], dtype=np.float64).reshape(-1, 3)
+            arrays.append(vertices)
+            lengths.append(len(vertices))
+            edge_ids.append(edge['id'])
+            edge_parts.append(index)
+
+    vertices = np.concatenate(arrays) if len(arrays) > 0 else np.zeros((0, 3))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return TessellatedEdges(vertices, offsets, edge_ids, np.asarray(edge_parts, dtype=np.int64), found_parts)
+
+
+class MassPropertiesTable():
+    '''
+    Mass properties of the parts in a part studio, stored as arrays with one row
+    per part. Values are in SI units, about the centroid of each part and in the
+    coordinates of the part studio.
+
+    Attributes:
+        - part_ids (list): Ids of the parts, in the order they were returned
+        - index (dict): Row of each part, keyed by part id
+        - mass (ndarray): (n,) mass of each part
+        - volume (ndarray): (n,) volume of each part
+        - centroid (ndarray): (n, 3) centroid of each part
+        - inertia (ndarray): (n, 3, 3) inertia tensor of each part
+        - principal_inertia (ndarray): (n, 3) principal moments of inertia of each part
+        - principal_axes (ndarray): (n, 3, 3) principal axes of each part, one per row
+    '''
+
+    fields = ('mass', 'volume', 'centroid', 'inertia', 'principal_inertia', 'principal_axes')
+
+    def __init__(self, part_ids, mass, volume, centroid, inertia, principal_inertia, principal_axes):
+        self.part_ids = part_ids
+        self.index = {part_id: i for i, part_id in enumerate(part_ids)}
+        self.mass = mass
+        self.volume = volume
+        self.centroid = centroid
+        self.inertia = inertia
+        self.principal_inertia = principal_inertia
+        self.principal_axes = principal_axes
+
+    def __len__(self):
+        return len(self.part_ids)
+
+    def __contains__(self, part_id):
+        return part_id in self.index
+
+    def __getitem__(self, part_id):
+        '''
+        Gets the mass properties of a part.
+
+        Args:
+            - part_id (str): Id of the part
+
+        Returns:
+            - dict: Values of the part keyed by field (see `fields`); arrays are views into the table
+        '''
+
+        i = self.index[part_id]
+        return {field: getattr(self, field)[i] for field in self.fields}
+
+
+def parse_mass_properties(response):
+    '''
+    Parses a mass properties response (from `Client.get_partstudio_mass_properties`
+    or `Client.get_mass_properties`) into a `MassPropertiesTable`. Onshape gives
+    each value with its lower and upper bounds; only the value is kept. Bodies
+    without mass (e.g. surfaces) are left out.
+
+    Args:
+        - response (dict): Parsed JSON response, with the properties of each part under `bodies`
+
+    Returns:
+        - MassPropertiesTable: Mass properties indexed by part id
+    '''
+
+    bodies = [(part_id, body) for part_id, body in response['bodies'].items() if body.get('hasMass', True)]
+    n = len(bodies)
+    mass, volume = np.zeros(n), np.zeros(n)
+    centroid, principal_inertia = np.zeros((n, 3)), np.zeros((n, 3))
+    inertia, principal_axes = np.zeros((n, 3, 3)), np.zeros((n, 3, 3))
+    for i, (part_id, body) in enumerate(bodies):
+        mass[i] = body['mass'][0]
+        volume[i] = body['volume'][0]
+        centroid[i] = body['centroid'][:3]
+        inertia[i] = np.reshape(body['inertia'][:9], (3, 3))
+        principal_inertia[i] = body['principalInertia'][:3]
+        principal_axes[i] = [[axis['x'], axis['y'], axis['z']] for axis in body['principalAxes'][:3]]
+    return MassPropertiesTable([part_id for part_id, body in bodies], mass, volume, centroid, inertia,
+                               principal_inertia, principal_axes)
@@ -0,0 +1,174 @@
+'''
+ledger
+======
+
+Record of the features pushed to part studios, used to update a model in place
+rather than rebuilding it
+'''
+
+import os
+import json
+import hashlib
+import threading
+
+__all__ = [
+    'FeatureLedger',
+    'feature_digest'
+]
+
+
+def feature_digest(body):
+    '''
+    Content hash of a feature definition, independent of key order and of the
+    featureId assigned by the server.
+
+    Args:
+        - body (dict or str): Feature definition call
+
+    Returns:
+        - str: Hex digest of the definition
+    '''
+
+    call = json.loads(body) if isinstance(body, (str, bytes)) else body
+    feature = {k: v for k, v in call.get('feature', {}).items() if k != 'featureId'}
+    canonical = json.dumps(dict(call, feature=feature), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class FeatureLedger():
+    '''
+    The last definition pushed for each named feature of a part studio, with the
+    featureId it was given. The ledger is kept in memory and, if a file is given,
+    appended to a JSON lines file as it changes, so it survives between runs.
+
+    Features are identified by name, so the names of a model must be unique
+    within its part studio.
+
+    Attributes:
+        - file_path (str, default=None): File to load the ledger from and save it to; in memory only if None
+    '''
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self._entries = {}
+        self._touched = set()
+        self._lock = threading.Lock()
+        if file_path is not None and os.path.isfile(file_path):
+            with open(file_path) as f:
+                for line in f:
+                    if line.strip():
+                        self._apply(json.loads(line))
+
+    @staticmethod
+    def _element(did, wid, eid):
+        return '%s/%s/%s' % (did, wid, eid)
+
+    def _apply(self, record):
+        features = self._entries.setdefault(record['element'], {})
+        if record.get('feature_id') is None:
+            features.pop(record['name'], None)
+        else:
+            features[record['name']] = (record['feature_id'], record['digest'])
+
+    def _write(self, record):
+        self._apply(record)
+        if self.file_path is not None:
+            with open(self.file_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def get(self, did, wid, eid, name):
+        '''
+        Gets the last pushed version of a feature, marking it as part of the current model.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - name (str): Name of the feature
+
+        Returns:
+            - tuple: (featureId, digest), or None if the feature was never pushed
+        '''
+
+        element = self._element(did, wid, eid)
+        with self._lock:
+            self._touched.add((element, name))
+            return self._entries.get(element, {}).get(name)
+
+    def record(self, did, wid, eid, name, feature_id, digest):
+        '''
+        Records that a feature was pushed.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+            - name (str): Name of the feature
+            - feature_id (str): featureId of the feature
+            - digest (str): `feature_digest` of the pushed definition
+        '''
+
+        element = self._element(did, wid, eid)
+        with self._lock:
+            self._touched.add((element, name))
+            if self._entries.get(element, {}).get(name) != (feature_id, digest):
+                self._write({'element': element, 'name': name, 'feature_id': feature_id, 'digest': digest})
+
+    def forget(self, did, wid, eid, name):
+        '''
+        Removes a feature from the ledger, e.g. once it has been deleted.
+        '''
+
+        element = self._element(did, wid, eid)
+        with self._lock:
+            if name in self._entries.get(element, {}):
+                self._write({'element': element, 'name': name, 'feature_id': None, 'digest': None})
+
+    def digests(self, did, wid, eid):
+        '''
+        Digests of the features of a part studio as last pushed, without marking
+        them as part of the current model.
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+
+        Returns:
+            - dict: `feature_digest` of each feature, keyed by featureId
+        '''
+
+        element = self._element(did, wid, eid)
+        with self._lock:
+            return {feature_id: digest for feature_id, digest in self._entries.get(element, {}).values()}
+
+    def stale(self, did, wid, eid):
+        '''
+        Features of the part studio that were pushed in an earlier run but not
+        looked up or recorded since the ledger was loaded, i.e. that are no longer
+        part of the model.
+
+        Returns:
+            - dict: featureIds of the stale features, keyed by name
+        '''
+
+        element = self._element(did, wid, eid)
+        with self._lock:
+            return {name: entry[0] for name, entry in self._entries.get(element, {}).items()
+                    if (element, name) not in self._touched}
+
+    def compact(self):
+        '''
+        Rewrites the ledger file with only the current entries.
+        '''
+
+        if self.file_path is None:
+            return
+        with self._lock:
+            tmp_path = self.file_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                for element, features in self._entries.items():
+                    for name, (feature_id, digest) in features.items():
+                        f.write(json.dumps({'element': element, 'name': name, 'feature_id': feature_id,
+                                            'digest': digest}) + '\n')
+            os.replace(tmp_path, self.file_path)
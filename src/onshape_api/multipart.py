@@ -0,0 +1,122 @@
+'''
+multipart
+=========
+
+Streaming encoder for multipart/form-data request bodies
+'''
+
+import os
+import random
+import string
+
+__all__ = [
+    'MultipartEncoder'
+]
+
+
+class MultipartEncoder():
+    '''
+    A multipart/form-data body that is read from disk in chunks as it is sent,
+    rather than built in memory. Files are read in binary mode, and the total
+    length is known up front so that requests sets Content-Length.
+
+    Attributes:
+        - fields (list): (name, value) pairs of text fields
+        - files (list): (name, file path, content type) of files to send
+        - boundary (str, default=None): Multipart boundary; random if None
+        - chunk_size (int, default=64 kB): Bytes read from a file at a time
+    '''
+
+    def __init__(self, fields=(), files=(), boundary=None, chunk_size=1 << 16):
+        if boundary is None:
+            chars = string.ascii_letters + string.digits
+            boundary = ''.join(random.choice(chars) for i in range(16))
+        self.boundary = boundary
+        self.chunk_size = chunk_size
+
+        self._segments = []
+        for name, value in fields:
+            self._segments.append(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n'
+                                   % (boundary, name, value)).encode('utf-8'))
+        for name, file_path, content_type in files:
+            self._segments.append(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                                   'Content-Type: %s\r\n\r\n'
+                                   % (boundary, name, os.path.basename(file_path), content_type)).encode('utf-8'))
+            self._segments.append((file_path, os.path.getsize(file_path)))
+            self._segments.append(b'\r\n')
+        self._segments.append(('--%s--\r\n' % boundary).encode('utf-8'))
+
+        self._length = sum(len(s) if isinstance(s, bytes) else s[1] for s in self._segments)
+        self.seek(0)
+
+    @property
+    def content_type(self):
+        '''Value of the Content-Type header for the body.'''
+        return 'multipart/form-data; boundary="%s"' % self.boundary
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        '''
+        Rewinds the body so that it can be sent again. Only seeking to the start is supported.
+        '''
+
+        if offset != 0 or whence != 0:
+            raise ValueError('MultipartEncoder can only seek to the start')
+        self.close()
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+        return 0
+
+    def close(self):
+        '''Closes the file currently being read, if any.'''
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+        self._file = None
+
+    def read(self, size=-1):
+        '''
+        Reads the next bytes of the body.
+
+        Args:
+            - size (int, default=-1): Maximum number of bytes to read; everything left if negative
+
+        Returns:
+            - bytes: The next part of the body, empty once it has all been read
+        '''
+
+        if size is None or size < 0:
+            size = self._length - self._position
+        out = []
+        remaining = size
+        while remaining > 0 and self._index < len(self._segments):
+            segment = self._segments[self._index]
+            if isinstance(segment, bytes):
+                data = segment[self._offset:self._offset + remaining]
+            else:
+                if self._file is None:
+                    self._file = open(segment[0], 'rb')
+                data = self._file.read(min(remaining, self.chunk_size))
+            if len(data) == 0:
+                self.close()
+                self._index += 1
+                self._offset = 0
+                continue
+            self._offset += len(data)
+            remaining -= len(data)
+            out.append(data)
+        chunk = b''.join(out)
+        self._position += len(chunk)
+        return chunk
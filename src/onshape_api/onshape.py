@@ -6,6 +6,9 @@ Provides access to the Onshape REST API
 '''
 
 from onshape_api import utils
+from onshape_api.cache import ResponseCache
+from onshape_api.transport import SessionTransport
+from onshape_api.scheduler import for_stack
 
 import os
 import random
@@ -15,6 +18,7 @@ import hmac
 import hashlib
 import base64
 import datetime
+import time
 import requests
 import urllib.parse as urlparse
 from urllib.parse import parse_qs
@@ -32,9 +36,17 @@ class Onshape():
         - stack (str): Base URL
         - creds (str, default='./creds.json'): Credentials location
         - logging (bool, default=True): Turn logging on or off
+        - pool_size (int, default=10): Maximum number of keep-alive connections to the stack
+        - cache_dir (str, default=None): Folder for caching GET responses on disk; no caching if None
+        - cache_size (int, default=1 GB): Maximum size in bytes of the response cache
+        - tracer (utils.RequestTracer, default=None): Collects a record of every request
+        - transport (transport, default=None): Sends the signed requests; a pooled `SessionTransport` if None
+        - scheduler (scheduler.RequestScheduler, default=None): Rate limits and retries requests; the
+          scheduler shared by all clients of the stack if None
     '''
 
-    def __init__(self, stack, creds='./creds.json', logging=True):
+    def __init__(self, stack, creds='./creds.json', logging=True, pool_size=10, cache_dir=None, cache_size=1 << 30,
+                 tracer=None, transport=None, scheduler=None):
         '''
         Instantiates an instance of the Onshape class. Reads credentials from a JSON file
         of this format:
@@ -53,6 +65,36 @@ class Onshape():
         Args:
             - stack (str): Base URL
             - creds (str, default='./creds.json'): Credentials location
+            - logging (bool, default=True): Turn logging on or off
+            - pool_size (int, default=10): Maximum number of keep-alive connections to the stack
+            - cache_dir (str, default=None): Folder for caching GET responses on disk; no caching if None
+            - cache_size (int, default=1 GB): Maximum size in bytes of the response cache
+            - tracer (utils.RequestTracer, default=None): Collects a record of every request
+            - transport (transport, default=None): Sends the signed requests; a pooled `SessionTransport` if None
+            - scheduler (scheduler.RequestScheduler, default=None): Rate limits and retries requests; the
+              scheduler shared by all clients of the stack if None
+        '''
+
+        self._tracer = tracer
+        self._cache = ResponseCache(cache_dir, max_bytes=cache_size) if cache_dir is not None else None
+        self._read_creds(stack, creds, logging)
+
+        if transport is None:
+            transport = SessionTransport(self._url, pool_size=pool_size, logging=self._logging)
+        self._transport = transport
+        self._scheduler = scheduler if scheduler is not None else for_stack(self._url)
+
+        if self._logging:
+            utils.log('onshape instance created: url = %s, access key = %s' % (self._url, self._access_key))
+
+    def _read_creds(self, stack, creds, logging):
+        '''
+        Reads the keys for the stack from the credentials file.
+
+        Args:
+            - stack (str): Base URL
+            - creds (str): Credentials location
+            - logging (bool): Turn logging on or off
         '''
 
         if not os.path.isfile(creds):
@@ -71,8 +113,18 @@ class Onshape():
             except TypeError:
                 raise ValueError('%s is not valid json' % creds)
 
-        if self._logging:
-            utils.log('onshape instance created: url = %s, access key = %s' % (self._url, self._access_key))
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        Closes the transport and any open connections to the stack.
+        '''
+
+        self._transport.close()
 
     def _make_nonce(self):
         '''
@@ -155,7 +207,77 @@ class Onshape():
 
         return req_headers
 
-    def request(self, method, path, query={}, headers={}, body={}, base_url=None):
+    def _cached_response(self, url, meta, body_path=None, content=None):
+        '''
+        Builds a response from an entry of the response cache. The body is read
+        into the response, so no file is left open.
+
+        Args:
+            - url (str): URL of the cached request
+            - meta (dict): Cache entry metadata
+            - body_path (str, default=None): Location of the cached body
+            - content (bytes, default=None): Body, if already read; else read from `body_path`
+
+        Returns:
+            - requests.Response: Response as if returned by Onshape, or None if the
+              entry was evicted before its body was read
+        '''
+
+        if content is None:
+            try:
+                with open(body_path, 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                return None
+
+        res = requests.Response()
+        res.status_code = meta['status']
+        res.headers.update(meta['headers'])
+        res.headers['Content-Length'] = str(len(content))
+        res.url = url
+        res._content = content
+        res._content_consumed = True
+        res.from_cache = True
+        return res
+
+    @staticmethod
+    def _body_size(body):
+        '''
+        Size in bytes of a request body as sent, or None if it is a stream of unknown length.
+        '''
+
+        if isinstance(body, str):
+            return len(body.encode('utf-8'))
+        try:
+            return len(body)
+        except TypeError:
+            return None
+
+    def _trace(self, method, path, res, started, ttfb=None, retries=0, sent_bytes=None):
+        '''
+        Records a finished request with the tracer, if there is one. The response body
+        is not read; its size is taken from the Content-Length header, and the time
+        taken to open a connection from the `timings` the transport reports.
+
+        Args:
+            - method (str): HTTP method
+            - path (str): Request path
+            - res (requests.Response): Response returned to the caller
+            - started (float): `time.perf_counter()` when the request began
+            - ttfb (float, default=None): Time until the response headers arrived
+            - retries (int, default=0): Number of times the request was retried
+            - sent_bytes (int, default=None): Size of the request body, if one was sent
+        '''
+
+        if self._tracer is None:
+            return
+        length = res.headers.get('Content-Length')
+        timings = getattr(res, 'timings', {})
+        self._tracer.record(method, path, res.status_code, nbytes=int(length) if length is not None else None,
+                            nbytes_sent=sent_bytes, dns=timings.get('dns'), connect=timings.get('connect'),
+                            ttfb=ttfb, total=time.perf_counter() - started, retries=retries)
+
+    def request(self, method, path, query={}, headers={}, body={}, base_url=None, cache=False):
         '''
         Issues a request to Onshape
 
@@ -166,25 +288,86 @@ class Onshape():
             - headers (dict, default={}): Key-value pairs of headers
             - body (dict, default={}): Body for POST request
             - base_url (str, default=None): Host, including scheme and port (if different from creds file)
+            - cache (bool, default=False): Whether a GET response may be served from / stored in the response cache
 
         Returns:
             - requests.Response: Object containing the response from Onshape
         '''
 
+        started = time.perf_counter()
         req_headers = self._make_headers(method, path, query, headers)
         if base_url is None:
             base_url = self._url
         url = base_url + path + '?' + urlparse.urlencode(query)
 
         if self._logging:
-            utils.log(body)
-            utils.log(req_headers)
-            utils.log('request url: ' + url)
+            utils.log('request body: %s', body)
+            utils.log('request headers: %s', req_headers)
+            utils.log('request url: %s', url)
+
+        cache_key = None
+        if cache and self._cache is not None and method.lower() == 'get':
+            cache_key = self._cache.key(url, req_headers.get('Accept'))
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                meta, body_path = cached
+                res = self._cached_response(url, meta, body_path) if meta['immutable'] else None
+                if res is not None:
+                    self._trace(method, path, res, started)
+                    return res
+                if not meta['immutable'] and meta['etag'] is not None:
+                    req_headers['If-None-Match'] = meta['etag']
 
         # only parse as json string if we have to
-        body = json.dumps(body) if type(body) == dict else body
-
-        res = requests.request(method, url, headers=req_headers, data=body, allow_redirects=False, stream=True)
+        body = json.dumps(body) if isinstance(body, dict) else body
+        sent_bytes = self._body_size(body) if self._tracer is not None else None
+
+        sent = None
+
+        def send():
+            nonlocal sent
+            if sent is not None:
+                # retrying: nonces cannot be reused, and streamed bodies must be rewound
+                req_headers.update(self._make_headers(method, path, query, headers))
+                if hasattr(body, 'seek'):
+                    body.seek(0)
+            sent = time.perf_counter()
+            return self._transport.send(method, url, req_headers, body)
+
+        res, retries = self._scheduler.run(send, method)
+        ttfb = time.perf_counter() - sent
+
+        if cache_key is not None:
+            if res.status_code == 304:
+                res.close()
+                # The entry is looked up again, as it may have been evicted while the request was in flight
+                cached = self._cache.get(cache_key)
+                res = self._cached_response(url, *cached) if cached is not None else None
+                if res is not None:
+                    if self._logging:
+                        utils.log('request not modified, reading from cache: %s', url)
+                    self._trace(method, path, res, started, ttfb, retries, sent_bytes)
+                    return res
+                req_headers.pop('If-None-Match', None)
+                res, more_retries = self._scheduler.run(send, method)
+                retries += more_retries
+                ttfb = time.perf_counter() - sent
+            immutable = self._cache.is_immutable(path)
+            if res.status_code == 200 and (immutable or 'ETag' in res.headers):
+                kept = {h: res.headers[h] for h in ('Content-Type', 'ETag') if h in res.headers}
+                chunks = []
+                def body_chunks():
+                    for chunk in res.iter_content(self._cache.chunk_size):
+                        chunks.append(chunk)
+                        yield chunk
+                meta, body_path = self._cache.put(cache_key, body_chunks(), res.status_code, kept,
+                                                  immutable=immutable)
+                res.close()
+                res = self._cached_response(url, meta, content=b''.join(chunks))
+                self._trace(method, path, res, started, ttfb, retries, sent_bytes)
+                return res
+
+        self._trace(method, path, res, started, ttfb, retries, sent_bytes)
 
         if res.status_code == 307:
             location = urlparse(res.headers["Location"])
@@ -199,12 +382,12 @@ class Onshape():
             for key in querystring:
                 new_query[key] = querystring[key][0]  # won't work for repeated query params
 
-            return self.request(method, location.path, query=new_query, headers=headers, base_url=new_base_url)
+            return self.request(method, location.path, query=new_query, headers=headers, base_url=new_base_url, cache=cache)
         elif not 200 <= res.status_code <= 206:
             if self._logging:
-                utils.log('request failed, details: ' + res.text, level=1)
+                utils.log('request failed, details: %s', utils.lazy(lambda: res.text), level=1)
         else:
             if self._logging:
-                utils.log('request succeeded, details: ' + res.text)
+                utils.log('request succeeded, status: %d' % res.status_code)
 
         return res
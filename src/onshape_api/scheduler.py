@@ -0,0 +1,266 @@
+'''
+scheduler
+=========
+
+Rate-limit-aware scheduling of requests to a stack: a token bucket on the request
+rate, an AIMD (additive increase, multiplicative decrease) limit on concurrent
+requests, and retries with Retry-After-aware exponential backoff and jitter
+'''
+
+from onshape_api import utils
+
+import time
+import random
+import threading
+import datetime
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+__all__ = [
+    'TokenBucket',
+    'AIMDLimiter',
+    'RequestScheduler',
+    'for_stack'
+]
+
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'DELETE')
+
+
+def connect_failed(error):
+    '''
+    Whether a request failed while connecting, before any of it was sent, so that
+    it can be retried whatever its method.
+
+    Args:
+        - error (requests.RequestException): Error raised by the request
+
+    Returns:
+        - bool: True for connect timeouts and refused connections
+    '''
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    for arg in error.args:
+        reason = getattr(arg, 'reason', arg)
+        if isinstance(reason, ConnectTimeoutError):  # includes NewConnectionError
+            return True
+    return False
+
+
+class TokenBucket():
+    '''
+    Limits the average request rate while allowing short bursts.
+
+    Attributes:
+        - rate (float): Tokens added per second
+        - burst (float, default=None): Maximum number of tokens held; `rate` if None
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Takes a token, waiting until one is available.
+
+        Returns:
+            - float: Seconds spent waiting
+        '''
+
+        waited = 0.
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AIMDLimiter():
+    '''
+    Limits the number of requests in flight. The limit grows by about one for
+    every `limit` successful requests, and is cut by `decrease` whenever the
+    server pushes back, so that concurrency settles just below the server's limit.
+
+    Attributes:
+        - initial (int, default=8): Starting limit
+        - minimum (int, default=1): Smallest limit
+        - maximum (int, default=64): Largest limit
+        - increase (float, default=1.): Growth of the limit per window of successful requests
+        - decrease (float, default=0.5): Factor applied to the limit when throttled
+    '''
+
+    def __init__(self, initial=8, minimum=1, maximum=64, increase=1., decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        '''Waits until a request may be started.'''
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False, failed=False):
+        '''
+        Marks a request as finished, adjusting the limit.
+
+        Args:
+            - throttled (bool, default=False): Whether the server asked to slow down
+            - failed (bool, default=False): Whether the request got no response, which
+              leaves the limit unchanged
+        '''
+
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            elif not failed:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+
+class RequestScheduler():
+    '''
+    Sends requests through a token bucket and an AIMD concurrency limit, retrying
+    throttled requests (429) and connections that failed before the request was
+    sent. Idempotent requests (GET, HEAD, DELETE) are also retried when the stack is
+    unavailable (502/503/504) or the connection fails or times out later on; other
+    requests are not, as the server may already have acted on them.
+
+    Attributes:
+        - rate (float, default=None): Maximum requests per second; unlimited if None
+        - burst (float, default=None): Requests allowed in a burst; `rate` if None
+        - concurrency (int, default=8): Starting limit on requests in flight; unlimited if None
+        - max_concurrency (int, default=64): Largest limit on requests in flight
+        - max_retries (int, default=5): Retries before giving up and returning the last response
+        - backoff (float, default=0.5): Base delay in seconds, doubled on each retry
+        - max_backoff (float, default=30.): Longest delay between retries
+        - logging (bool, default=False): Turn logging on or off
+    '''
+
+    def __init__(self, rate=None, burst=None, concurrency=8, max_concurrency=64, max_retries=5,
+                 backoff=0.5, max_backoff=30., logging=False):
+        self.bucket = TokenBucket(rate, burst) if rate is not None else None
+        self.limiter = AIMDLimiter(concurrency, maximum=max_concurrency) if concurrency is not None else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._logging = logging
+
+    def delay(self, attempt, res=None):
+        '''
+        Seconds to wait before a retry: the server's Retry-After if it sent one,
+        otherwise exponential backoff with full jitter.
+
+        Args:
+            - attempt (int): Number of the retry, starting at 0
+            - res (requests.Response, default=None): Response that is being retried
+
+        Returns:
+            - float: Seconds to wait
+        '''
+
+        retry_after = res.headers.get('Retry-After') if res is not None else None
+        if retry_after is not None:
+            try:
+                return min(self.max_backoff, max(0., float(retry_after)))
+            except ValueError:
+                try:
+                    when = parsedate_to_datetime(retry_after)
+                    now = datetime.datetime.now(datetime.timezone.utc)
+                    return min(self.max_backoff, max(0., (when - now).total_seconds()))
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def run(self, send, method='GET'):
+        '''
+        Sends a request, retrying it as needed.
+
+        Args:
+            - send (callable): Sends the request once and returns the response; called
+              again for every retry, so it should re-sign the request
+            - method (str, default='GET'): HTTP method, which decides what is retried
+
+        Returns:
+            - tuple: (requests.Response, number of retries)
+        '''
+
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            if self.limiter is not None:
+                self.limiter.acquire()
+            res, error, throttled, retry = None, None, False, False
+            try:
+                res = send()
+                throttled = res.status_code in RETRY_STATUSES
+                retry = res.status_code == 429 or (throttled and idempotent)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # a failed connection says nothing about the server's rate limit
+                error = e
+                retry = idempotent or connect_failed(e)
+                if not retry:
+                    raise
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release(throttled=throttled, failed=res is None)
+
+            if not retry:
+                return res, attempt
+            if attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return res, attempt
+
+            wait = self.delay(attempt, res)
+            if self._logging:
+                reason = repr(error) if error is not None else 'status %d' % res.status_code
+                utils.log('retrying %s request after %s in %.2f s' % (method.upper(), reason, wait), level=1)
+            if res is not None:
+                res.close()
+            time.sleep(wait)
+            attempt += 1
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def for_stack(stack, **kwargs):
+    '''
+    Returns the scheduler shared by every client of a stack, creating it with
+    the given settings on first use.
+
+    Args:
+        - stack (str): Base URL of the stack
+        - **kwargs: Settings passed to `RequestScheduler` if it is created
+
+    Returns:
+        - RequestScheduler: Scheduler for the stack
+    '''
+
+    with _schedulers_lock:
+        if stack not in _schedulers:
+            _schedulers[stack] = RequestScheduler(**kwargs)
+        return _schedulers[stack]
@@ -0,0 +1,496 @@
+'''
+standin
+=======
+
+A small local HTTP server standing in for the Onshape REST API, for running and
+benchmarking scripts offline. It fakes the endpoints used by `Client` (features,
+featurescript, massproperties, stl, ...) with configurable latency and throttling.
+Requests are not authenticated.
+
+Example:
+
+    with StandInServer(latency=0.05) as server:
+        server.write_creds('./standin_creds.json')
+        client = Client(stack=server.url, creds='./standin_creds.json')
+'''
+
+from onshape_api import utils
+
+import re
+import sys
+import json
+import math
+import time
+import struct
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+__all__ = [
+    'StandInServer'
+]
+
+DEFAULT_PLANES = ('Front', 'Top', 'Right')
+DENSITY = 7850.  # kg/m^3, steel
+
+
+def _length(expression):
+    '''
+    Converts a quantity expression such as "25 mm" to meters.
+    '''
+
+    scale = {'m': 1., 'mm': 1e-3, 'cm': 1e-2, 'in': 0.0254}
+    value, *unit = expression.split()
+    return float(value) * scale[unit[0] if unit else 'm']
+
+
+def _touch(a, b):
+    '''Whether two cylinders (radius, x, y, z start, z end) along z overlap or share a face.'''
+    ra, xa, ya, za0, za1 = a
+    rb, xb, yb, zb0, zb1 = b
+    eps = 1e-12
+    return (min(za1, zb1) - max(za0, zb0) > -eps
+            and math.hypot(xa - xb, ya - yb) < ra + rb)
+
+
+class _PartStudio():
+    '''
+    Feature list of a fake part studio, with just enough geometry to answer mass
+    property queries for circular extrudes.
+    '''
+
+    def __init__(self):
+        self.features = {}
+        self.microversion = 0
+        self._next_id = 0
+        self._heights = {}
+        self._heights_microversion = None
+
+    def new_feature_id(self):
+        self._next_id += 1
+        return 'F%05dX' % self._next_id
+
+    def face_ids(self, feature_id):
+        '''Deterministic ids of the faces created by a feature; the last is the end cap.'''
+        if feature_id in DEFAULT_PLANES:
+            return ['J%sP' % feature_id[0]]
+        if feature_id not in self.features:
+            return []
+        return ['J%sS' % feature_id, 'J%sE' % feature_id]
+
+    def _face_feature(self, face_id):
+        for plane in DEFAULT_PLANES:
+            if face_id == 'J%sP' % plane[0]:
+                return plane
+        return face_id[1:-1]
+
+    def _parameter(self, feature, parameter_id):
+        for param in feature.get('parameters', []):
+            if param.get('parameterId') == parameter_id:
+                return param
+        return None
+
+    def _update_heights(self):
+        '''
+        Computes the height of every plane and the end height of every extrude, in
+        feature order as features only reference the ones before them, so that a
+        long chain of features is not walked recursively. Kept until the part
+        studio changes.
+        '''
+
+        if self._heights_microversion == self.microversion:
+            return
+        self._heights = {}
+        self._heights_microversion = self.microversion
+        for feature_id, feature in self.features.items():
+            if feature.get('featureType') == 'cPlane':
+                base = self._parameter(feature, 'entities')['queries'][0]
+                self._heights[feature_id] = (self.plane_height(base)
+                                             + _length(self._parameter(feature, 'offset')['expression']))
+            elif feature.get('featureType') == 'extrude':
+                self._heights[feature_id] = self.extrude_span(feature)[1]
+
+    def plane_height(self, query):
+        '''Height along the normal of the Front plane of the plane or face selected by a query.'''
+        if 'featureId' in query:
+            feature_id = query['featureId']
+        else:
+            feature_id = self._face_feature(query['deterministicIds'][0])
+        if feature_id in DEFAULT_PLANES:
+            return 0.
+        self._update_heights()
+        return self._heights[feature_id]
+
+    def extrude_span(self, feature):
+        '''Start and end heights of an extrude.'''
+        sketch_id = self._parameter(feature, 'entities')['queries'][0]['featureId']
+        sketch = self.features[sketch_id]
+        start = self.plane_height(self._parameter(sketch, 'sketchPlane')['queries'][0])
+        return start, start + _length(self._parameter(feature, 'depth')['expression'])
+
+    def cylinders(self, features=None):
+        '''(radius, x, y, z start, z end) of every circular extrude, or of those in `features`.'''
+        out = []
+        for feature in (self.features.values() if features is None else features):
+            if feature.get('featureType') != 'extrude':
+                continue
+            sketch_id = self._parameter(feature, 'entities')['queries'][0]['featureId']
+            circle = self.features[sketch_id]['entities'][0]['geometry']
+            out.append((circle['radius'], circle['xCenter'], circle['yCenter'], *self.extrude_span(feature)))
+        return out
+
+    def parts(self):
+        '''
+        Extrudes of each part, keyed by part id, in feature order. A NEW extrude
+        makes a part; an ADD extrude joins the parts made before it that it touches,
+        or makes a part if it touches none.
+        '''
+
+        bodies = []
+        for feature in self.features.values():
+            if feature.get('featureType') != 'extrude':
+                continue
+            cylinder = self.cylinders([feature])[0]
+            touched = []
+            if self._parameter(feature, 'operationType')['value'] == 'ADD':
+                touched = [i for i, body in enumerate(bodies)
+                           if any(_touch(cylinder, other) for other in self.cylinders(body))]
+            if not touched:
+                bodies.append([feature])
+                continue
+            # The joined part keeps the place (and id) of the first part it touches
+            bodies[touched[0]] = [f for i in touched for f in bodies[i]] + [feature]
+            bodies = [body for i, body in enumerate(bodies) if i not in touched[1:]]
+        return {'J%sD' % chr(ord('H') + i): body for i, body in enumerate(bodies)}
+
+    def mass_properties(self, features=None):
+        '''Mass properties of a part made of the extrudes in `features` (all by default), in the Onshape format.'''
+        pieces = []
+        for r, x, y, z0, z1 in self.cylinders(features):
+            h = z1 - z0
+            m = DENSITY * math.pi * r ** 2 * h
+            own = (m * (3 * r ** 2 + h ** 2) / 12, m * (3 * r ** 2 + h ** 2) / 12, m * r ** 2 / 2)
+            pieces.append((m, (x, y, (z0 + z1) / 2), own))
+        mass = sum(m for m, _, _ in pieces)
+        centroid = [sum(m * c[i] for m, c, _ in pieces) / mass if mass > 0 else 0. for i in range(3)]
+
+        inertia = [0.] * 9
+        for m, c, own in pieces:
+            d = [c[i] - centroid[i] for i in range(3)]
+            dd = sum(v ** 2 for v in d)
+            for i in range(3):
+                for j in range(3):
+                    inertia[3 * i + j] += (own[i] + m * dd if i == j else 0.) - m * d[i] * d[j]
+        principal = [inertia[0], inertia[4], inertia[8]]
+        return {
+            'mass': [mass, mass, mass],
+            'volume': [mass / DENSITY] * 3,
+            'centroid': centroid + centroid + centroid,
+            'inertia': inertia + inertia + inertia,
+            'principalInertia': principal,
+            'principalAxes': [{'x': 1., 'y': 0., 'z': 0.}, {'x': 0., 'y': 1., 'z': 0.}, {'x': 0., 'y': 0., 'z': 1.}],
+            'hasMass': True
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing pooled keep-alive connections is expected, not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def log_message(self, format, *args):
+        if self.server.standin.logging:
+            utils.log(format % args)
+
+    def do_GET(self):
+        self.server.standin.handle(self)
+
+    def do_POST(self):
+        self.server.standin.handle(self)
+
+    def do_DELETE(self):
+        self.server.standin.handle(self)
+
+
+class StandInServer():
+    '''
+    Local stand-in for the Onshape REST API, served from a background thread.
+
+    Attributes:
+        - latency (float, default=0.): Seconds to wait before answering each request
+        - rate_limit (float, default=None): Requests per second allowed before answering
+          429 with a Retry-After header; unlimited if None
+        - stl_triangles (int, default=1000): Number of triangles in STL exports
+        - port (int, default=0): Port to listen on; a free port if 0
+        - logging (bool, default=False): Turn logging on or off
+    '''
+
+    def __init__(self, latency=0., rate_limit=None, stl_triangles=1000, port=0, logging=False):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.stl_triangles = stl_triangles
+        self.logging = logging
+        self.stats = {'calls': 0, 'throttled': 0, 'bytes_in': 0, 'bytes_out': 0, 'paths': {}}
+        self.part_studios = {}
+        self.blobs = []
+        self._elements = 0
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+        self._httpd = _Server(('127.0.0.1', port), _Handler)
+        self._httpd.standin = self
+        self._thread = None
+
+    @property
+    def url(self):
+        '''Base URL to use as the `stack` of a client.'''
+        return 'http://127.0.0.1:%d' % self._httpd.server_address[1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        '''Starts serving in a background thread.'''
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''Stops serving and closes the socket.'''
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def write_creds(self, file_path):
+        '''
+        Writes a credentials file for the stand-in, for use as `creds` of a client.
+
+        Args:
+            - file_path (str): Location of the file to write
+        '''
+
+        with open(file_path, 'w') as f:
+            json.dump({self.url: {'access_key': 'standin', 'secret_key': 'standin'}}, f)
+
+    def mass_properties(self, did, wid, eid):
+        '''
+        Mass properties of each part of a part studio, without going through HTTP
+        (e.g. to check a model built by a benchmark).
+
+        Args:
+            - did (str): Document ID
+            - wid (str): Workspace ID
+            - eid (str): Element ID
+
+        Returns:
+            - dict: Mass properties in the Onshape response format, keyed by part id
+        '''
+
+        with self._lock:
+            studio = self._studio(did, wid, eid)
+            return {part_id: studio.mass_properties(body) for part_id, body in studio.parts().items()}
+
+    def reset_stats(self):
+        '''Zeroes the request counters.'''
+        with self._lock:
+            self.stats = {'calls': 0, 'throttled': 0, 'bytes_in': 0, 'bytes_out': 0, 'paths': {}}
+
+    def _throttled(self):
+        '''Takes a token from the bucket; returns the seconds to wait if there is none.'''
+        if self.rate_limit is None:
+            return None
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+        self._refilled = now
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.rate_limit
+        self._tokens -= 1
+        return None
+
+    def handle(self, request):
+        '''
+        Answers one request.
+
+        Args:
+            - request (BaseHTTPRequestHandler): The request being served
+        '''
+
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length > 0 else b''
+        path = request.path.split('?')[0]
+
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['bytes_in'] += len(body)
+            name = request.command + ' ' + utils.path_template(path)
+            self.stats['paths'][name] = self.stats['paths'].get(name, 0) + 1
+            wait = self._throttled()
+            if wait is not None:
+                self.stats['throttled'] += 1
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        if wait is not None:
+            self._send(request, 429, b'{"message": "Too many requests"}', headers={'Retry-After': str(math.ceil(wait))})
+            return
+
+        try:
+            status, payload, ctype = self._route(request.command, path, body, request.headers)
+        except (KeyError, IndexError, ValueError) as e:
+            status, payload, ctype = 400, json.dumps({'message': 'bad request: %r' % e}).encode('utf-8'), 'application/json'
+        self._send(request, status, payload, ctype=ctype)
+
+    def _send(self, request, status, payload, ctype='application/json', headers={}):
+        request.send_response(status)
+        request.send_header('Content-Type', ctype)
+        request.send_header('Content-Length', str(len(payload)))
+        for h in headers:
+            request.send_header(h, headers[h])
+        request.end_headers()
+        request.wfile.write(payload)
+        with self._lock:
+            self.stats['bytes_out'] += len(payload)
+
+    def _microversion(self, did, wid):
+        '''Microversion of a workspace, which changes whenever any of its part studios does.'''
+        return 'M%08d' % sum(s.microversion for k, s in self.part_studios.items() if k[:2] == (did, wid))
+
+    def _studio(self, did, wid, eid):
+        key = (did, wid, eid)
+        if key not in self.part_studios:
+            self.part_studios[key] = _PartStudio()
+        return self.part_studios[key]
+
+    def _route(self, method, path, body, headers):
+        '''
+        Dispatches a request to the fake endpoint for its path.
+
+        Returns:
+            - tuple: (status, body (bytes), content type)
+        '''
+
+        match = re.search(r'/d/([^/]+)/[wvm]/([^/]+)/e/([^/]+)/(.*)$', path)
+        if match is None and method == 'POST' and re.search(r'/blobelements/d/[^/]+/w/[^/]+$', path):
+            with self._lock:
+                self.blobs.append(body)
+                blob = {'id': 'B%05dX' % len(self.blobs), 'size': len(body)}
+            return 200, json.dumps(blob).encode('utf-8'), 'application/json'
+        if match is None and method == 'POST' and re.search(r'/partstudios/d/[^/]+/w/[^/]+$', path):
+            with self._lock:
+                self._elements += 1
+                element = {'id': 'E%05dX' % self._elements, 'name': json.loads(body).get('name')}
+            return 200, json.dumps(element).encode('utf-8'), 'application/json'
+        if match is None:
+            match = re.search(r'/documents/d/([^/]+)/w/([^/]+)/currentmicroversion$', path)
+            if match is not None:
+                with self._lock:
+                    microversion = self._microversion(*match.groups())
+                return 200, json.dumps({'microversion': microversion}).encode('utf-8'), 'application/json'
+            return 404, b'{"message": "not found"}', 'application/json'
+
+        did, wid, eid, rest = match.groups()
+        with self._lock:
+            studio = self._studio(did, wid, eid)
+            if method == 'POST' and rest == 'features':
+                out = self._add_feature(studio, json.loads(body))
+                out['sourceMicroversion'] = self._microversion(did, wid)
+            elif method == 'POST' and rest.startswith('features/featureid/'):
+                feature_id = rest.split('/')[-1]
+                if feature_id not in studio.features:
+                    return 404, b'{"message": "feature not found"}', 'application/json'
+                out = self._update_feature(studio, feature_id, json.loads(body))
+                out['sourceMicroversion'] = self._microversion(did, wid)
+            elif method == 'DELETE' and rest.startswith('features/featureid/'):
+                studio.features.pop(rest.split('/')[-1], None)
+                studio.microversion += 1
+                out = {}
+            elif method == 'GET' and rest == 'features':
+                out = {'features': list(studio.features.values())}
+            elif method == 'POST' and rest == 'featurescript':
+                out = self._featurescript(studio, json.loads(body)['script'])
+                out['sourceMicroversion'] = self._microversion(did, wid)
+            elif method == 'GET' and rest.endswith('massproperties'):
+                parts = studio.parts()
+                if rest.startswith('partid/'):
+                    part_id = rest.split('/')[1]
+                    if part_id not in parts:
+                        return 404, b'{"message": "part not found"}', 'application/json'
+                    parts = {part_id: parts[part_id]}
+                out = {'bodies': {part_id: studio.mass_properties(body) for part_id, body in parts.items()}}
+            elif method == 'GET' and rest == 'tessellatededges':
+                out = self._tessellated_edges(studio)
+            elif method == 'GET' and rest == 'stl':
+                return 200, self._stl(), 'application/vnd.onshape.v1+octet-stream'
+            else:
+                return 404, b'{"message": "not found"}', 'application/json'
+        return 200, json.dumps(out).encode('utf-8'), 'application/json'
+
+    def _add_feature(self, studio, call):
+        feature = call['feature']
+        feature['featureId'] = studio.new_feature_id()
+        studio.features[feature['featureId']] = feature
+        studio.microversion += 1
+        return {
+            'btType': 'BTFeatureDefinitionResponse-1617',
+            'feature': feature,
+            'featureState': {'featureStatus': 'OK'}
+        }
+
+    def _update_feature(self, studio, feature_id, call):
+        feature = call['feature']
+        feature['featureId'] = feature_id
+        studio.features[feature_id] = feature
+        studio.microversion += 1
+        return {
+            'btType': 'BTFeatureDefinitionResponse-1617',
+            'feature': feature,
+            'featureState': {'featureStatus': 'OK'}
+        }
+
+    def _featurescript(self, studio, script):
+        '''
+        Answers the face queries made by `Client.get_face_ids` (many ids) and by
+        a single `qCreatedBy(makeId("..."), EntityType.FACE)` query.
+        '''
+
+        def strings(values):
+            return {'message': {'value': [{'message': {'value': v}} for v in values]}}
+
+        bulk = re.search(r'for \(var id in (\[.*?\])\)', script)
+        if bulk is not None:
+            feature_ids = json.loads(bulk.group(1))
+            value = [strings(studio.face_ids(f)) for f in feature_ids]
+            return {'result': {'message': {'value': value}}}
+        feature_id = re.search(r'makeId\("([^"]*)"\)', script).group(1)
+        return {'result': strings(studio.face_ids(feature_id))}
+
+    def _tessellated_edges(self, studio, points=36):
+        '''Circular end edges of every extrude, as edges of a single part.'''
+        edges = []
+        for i, (r, x, y, z0, z1) in enumerate(studio.cylinders()):
+            for side, z in (('S', z0), ('E', z1)):
+                vertices = [[x + r * math.cos(2 * math.pi * k / points), y + r * math.sin(2 * math.pi * k / points), z]
+                            for k in range(points + 1)]
+                edges.append({'id': 'J%d%s' % (i, side), 'vertices': vertices})
+        return [{'partId': 'JHD', 'edges': edges}]
+
+    def _stl(self):
+        '''Binary STL with `stl_triangles` facets.'''
+        n = self.stl_triangles
+        facets = bytearray()
+        for i in range(n):
+            a = 2 * math.pi * i / n
+            b = 2 * math.pi * (i + 1) / n
+            facets += struct.pack('<12fH', 0., 0., 1., 0., 0., 0., math.cos(a), math.sin(a), 0.,
+                                  math.cos(b), math.sin(b), 0., 0)
+        return b'standin binary stl'.ljust(80, b' ') + struct.pack('<I', n) + bytes(facets)
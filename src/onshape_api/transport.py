@@ -0,0 +1,326 @@
+'''
+transport
+=========
+
+Pluggable transports used by `Onshape.request` to send signed requests: a pooled
+HTTP session, and transports that record exchanges to a fixture store and replay
+them without a network connection
+'''
+
+from onshape_api import utils
+
+import io
+import os
+import json
+import base64
+import time
+import socket
+import hashlib
+import threading
+import urllib.parse as urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError, NewConnectionError, ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+
+__all__ = [
+    'SessionTransport',
+    'RecordingTransport',
+    'ReplayTransport'
+]
+
+
+# Time taken to resolve the host and open the connection of the request being sent by each thread
+_timings = threading.local()
+
+
+class _TimedConnection():
+    '''
+    Resolves the host before opening the socket, so that the time taken by each
+    is recorded in `_timings` of the sending thread.
+    '''
+
+    def _new_conn(self):
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(host.strip('[]'), self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = time.perf_counter()
+
+        sock, error = None, None
+        for *_, address in addresses:
+            # connect to the resolved address, so that urllib3 does not resolve the host again
+            self._dns_host = address[0]
+            try:
+                sock = super()._new_conn()
+                break
+            except (NewConnectionError, ConnectTimeoutError) as e:
+                error = e
+            finally:
+                self._dns_host = host
+        if sock is None:
+            raise error or NewConnectionError(self, 'getaddrinfo returned an empty list')
+
+        _timings.dns = resolved - started
+        _timings.connect = time.perf_counter() - resolved
+        return sock
+
+
+class _TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    '''
+    Adapter whose connections record how long opening them took.
+    '''
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class SessionTransport():
+    '''
+    Sends requests over a pooled, keep-alive session. The session is created on
+    first use and is safe to share between threads.
+
+    Attributes:
+        - url (str): Base URL of the stack the pool is mounted on
+        - pool_size (int, default=10): Maximum number of keep-alive connections to the stack
+        - logging (bool, default=False): Turn logging on or off
+    '''
+
+    def __init__(self, url, pool_size=10, logging=False):
+        self.url = url
+        self.pool_size = pool_size
+        self._logging = logging
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        '''
+        Returns the pooled session, creating it on first use.
+
+        Returns:
+            - requests.Session: Session with a connection pool mounted on the stack
+        '''
+
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = _TimedAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount(self.url, adapter)
+                    self._session = session
+
+                    if self._logging:
+                        utils.log('session created: url = %s, pool size = %d' % (self.url, self.pool_size))
+
+        return self._session
+
+    def send(self, method, url, headers, body):
+        '''
+        Sends a request without following redirects. The body of the response is
+        streamed, so it is only read when the caller asks for it.
+
+        The response has a `timings` dict with the time taken to resolve the host
+        (`dns`) and open the connection (`connect`), both None if a kept-alive
+        connection was reused.
+
+        Args:
+            - method (str): HTTP method
+            - url (str): Full URL, including the query string
+            - headers (dict): Signed request headers
+            - body (str, bytes or file-like): Request body
+
+        Returns:
+            - requests.Response: Response from the server
+        '''
+
+        session = self._get_session()
+        _timings.dns = _timings.connect = None
+        res = session.request(method, url, headers=headers, data=body, allow_redirects=False, stream=True)
+        res.timings = {'dns': _timings.dns, 'connect': _timings.connect}
+        return res
+
+    def close(self):
+        '''
+        Closes the session and any open connections.
+        '''
+
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+def _fixture_key(method, url, body):
+    '''
+    Identifies a request independently of its host, nonce and date, so that it
+    matches the same request made later or against a different stack.
+
+    Args:
+        - method (str): HTTP method
+        - url (str): Full URL, including the query string
+        - body (str, bytes or file-like): Request body
+
+    Returns:
+        - str: Hex digest identifying the request
+    '''
+
+    parts = urlparse.urlsplit(url)
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    elif not isinstance(body, bytes):
+        body = b''  # streamed bodies (e.g. file uploads) are matched on the URL only
+    digest = hashlib.sha256()
+    digest.update(('%s %s?%s\n' % (method.upper(), parts.path, parts.query)).encode('utf-8'))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _make_response(exchange, url):
+    '''
+    Rebuilds a response from a recorded exchange.
+
+    Args:
+        - exchange (dict): Recorded status, headers and base64 body
+        - url (str): URL of the request being answered
+
+    Returns:
+        - requests.Response: Response equivalent to the recorded one
+    '''
+
+    res = requests.Response()
+    res.status_code = exchange['status']
+    res.headers.update(exchange['headers'])
+    # served from a buffer like a live response, so that it can be streamed as well as read
+    res.raw = io.BytesIO(base64.b64decode(exchange['content']))
+    res.url = url
+    return res
+
+
+class RecordingTransport():
+    '''
+    Sends requests through another transport and records each exchange to a
+    fixture store, a folder with one JSON file per distinct request. Repeated
+    identical requests are stored in order, so they replay in the same order.
+
+    Attributes:
+        - inner (transport): Transport that actually sends the requests
+        - directory (str): Folder of the fixture store
+    '''
+
+    def __init__(self, inner, directory):
+        self.inner = inner
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, method, url, headers, body):
+        '''
+        Sends a request and records the exchange. The response body is read in full
+        so that it can be stored.
+
+        Args:
+            - method (str): HTTP method
+            - url (str): Full URL, including the query string
+            - headers (dict): Signed request headers
+            - body (str, bytes or file-like): Request body
+
+        Returns:
+            - requests.Response: Response from the inner transport
+        '''
+
+        res = self.inner.send(method, url, headers, body)
+        exchange = {
+            'method': method.upper(),
+            'path': urlparse.urlsplit(url).path,
+            'status': res.status_code,
+            'headers': {h: v for h, v in res.headers.items() if h.lower() not in ('content-encoding', 'transfer-encoding')},
+            'content': base64.b64encode(res.content).decode('ascii')
+        }
+
+        file_path = os.path.join(self.directory, _fixture_key(method, url, body) + '.json')
+        with self._lock:
+            exchanges = []
+            if os.path.isfile(file_path):
+                with open(file_path) as f:
+                    exchanges = json.load(f)
+            exchanges.append(exchange)
+            with open(file_path, 'w') as f:
+                json.dump(exchanges, f)
+
+        return res
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayTransport():
+    '''
+    Answers requests from a fixture store written by `RecordingTransport`, without
+    any network access. Each recorded exchange is replayed once, in the order it
+    was recorded; the last one is repeated if a request is made more often than
+    it was recorded.
+
+    Attributes:
+        - directory (str): Folder of the fixture store
+    '''
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            raise IOError('%s is not a directory' % directory)
+        self.directory = directory
+        self._played = {}
+        self._lock = threading.Lock()
+
+    def send(self, method, url, headers, body):
+        '''
+        Returns the recorded response for a request.
+
+        Args:
+            - method (str): HTTP method
+            - url (str): Full URL, including the query string
+            - headers (dict): Signed request headers (ignored)
+            - body (str, bytes or file-like): Request body
+
+        Returns:
+            - requests.Response: The recorded response
+        '''
+
+        key = _fixture_key(method, url, body)
+        file_path = os.path.join(self.directory, key + '.json')
+        if not os.path.isfile(file_path):
+            raise LookupError('no recorded response for %s %s' % (method.upper(), url))
+
+        with open(file_path) as f:
+            exchanges = json.load(f)
+        with self._lock:
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+
+        return _make_response(exchanges[min(index, len(exchanges) - 1)], url)
+
+    def close(self):
+        pass
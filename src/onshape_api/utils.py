@@ -5,22 +5,32 @@ utils
 Handy functions for API key sample app
 '''
 
+import re
+import json
+import math
+import time
 import logging
+import threading
+from collections import deque
 from logging.config import dictConfig
 
 __all__ = [
-    'log'
+    'log',
+    'lazy',
+    'path_template',
+    'RequestTracer'
 ]
 
+_configured = False
+_configure_lock = threading.Lock()
 
-def log(msg, level=0):
-    '''
-    Logs a message to the console, with optional level paramater
 
-    Args:
-        - msg (str): message to send to console
-        - level (int): log level; 0 for info, 1 for error (default = 0)
+def _configure():
     '''
+    Configures the `info` and `error` loggers. Only runs once per process.
+    '''
+
+    global _configured
 
     red = '\033[91m'
     endc = '\033[0m'
@@ -65,10 +75,197 @@ def log(msg, level=0):
         }
     }
 
-    dictConfig(cfg)
+    with _configure_lock:
+        if not _configured:
+            dictConfig(cfg)
+            _configured = True
+
+
+def log(msg, *args, level=0):
+    '''
+    Logs a message to the console, with optional level paramater. Any `args` are
+    %-formatted into the message only if it is emitted.
+
+    Args:
+        - msg (str): message to send to console
+        - args: values for the %-placeholders of `msg`
+        - level (int): log level; 0 for info, 1 for error (default = 0)
+    '''
+
+    if not _configured:
+        _configure()
 
     lg = 'info' if level == 0 else 'error'
     lvl = 20 if level == 0 else 40
 
     logger = logging.getLogger(lg)
-    logger.log(lvl, msg)
+    logger.log(lvl, msg, *args)
+
+
+class lazy():
+    '''
+    Log argument that is only computed if the message it is formatted into is
+    emitted, e.g. `log('details: %s', lazy(lambda: res.text))`.
+
+    Attributes:
+        - func (callable): Returns the value to log
+    '''
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+
+def path_template(path):
+    '''
+    Replaces the ids in an API path with placeholders, so that requests to the
+    same endpoint can be grouped, e.g. `/api/partstudios/d/:d/w/:w/e/:e/features`.
+
+    Args:
+        - path (str): Request path, without the query string
+
+    Returns:
+        - str: Path with ids replaced
+    '''
+
+    return re.sub(r'/(d|w|v|m|e|featureid|partid)/[^/]+', r'/\1/:\1', path)
+
+
+class RequestTracer():
+    '''
+    Collects one record per request made by `Onshape.request`, with method, path
+    template, status, bytes received and sent, latencies (seconds) and retry
+    count. Recording only appends a dict, so it can stay on without changing the
+    timings it measures; summaries are computed when asked for.
+
+    Latencies are `ttfb` (request sent until response headers arrive) and `total`
+    (including redirects and retries). `dns` and `connect` are the time taken to
+    resolve the host and open the connection, for requests that opened a new
+    connection; they are None for requests sent over a kept-alive connection.
+
+    Attributes:
+        - maxlen (int, default=100000): Maximum number of records kept (oldest dropped first)
+    '''
+
+    fields = ('time', 'method', 'path', 'status', 'bytes', 'bytes_sent', 'dns', 'connect', 'ttfb', 'total', 'retries')
+
+    def __init__(self, maxlen=100000):
+        self.records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def record(self, method, path, status, nbytes=None, nbytes_sent=None, dns=None, connect=None, ttfb=None,
+               total=None, retries=0):
+        '''
+        Adds the record of a finished request.
+
+        Args:
+            - method (str): HTTP method
+            - path (str): Request path; ids are replaced with `path_template`
+            - status (int): HTTP status code (None if no response was received)
+            - nbytes (int, default=None): Size of the response body
+            - nbytes_sent (int, default=None): Size of the request body
+            - dns (float, default=None): DNS lookup time
+            - connect (float, default=None): Connection setup time
+            - ttfb (float, default=None): Time to first byte of the response
+            - total (float, default=None): Total time for the request
+            - retries (int, default=0): Number of times the request was retried
+        '''
+
+        rec = {
+            'time': time.time(),
+            'method': method.upper(),
+            'path': path_template(path),
+            'status': status,
+            'bytes': nbytes,
+            'bytes_sent': nbytes_sent,
+            'dns': dns,
+            'connect': connect,
+            'ttfb': ttfb,
+            'total': total,
+            'retries': retries
+        }
+        with self._lock:
+            self.records.append(rec)
+
+    def clear(self):
+        '''Drops all records.'''
+        with self._lock:
+            self.records.clear()
+
+    @staticmethod
+    def _percentile(values, q):
+        '''Nearest-rank percentile of sorted values.'''
+        if len(values) == 0:
+            return None
+        rank = max(0, math.ceil(q / 100 * len(values)) - 1)
+        return values[rank]
+
+    @staticmethod
+    def _histogram(values):
+        '''Counts of latencies in power-of-two millisecond buckets, keyed by bucket upper bound.'''
+        buckets = {}
+        for value in values:
+            bound = 2 ** max(0, math.ceil(math.log2(max(value * 1000, 1))))
+            buckets[bound] = buckets.get(bound, 0) + 1
+        return dict(sorted(buckets.items()))
+
+    def summary(self, percentiles=(50, 90, 99)):
+        '''
+        Aggregates the records per endpoint.
+
+        Args:
+            - percentiles (tuple, default=(50, 90, 99)): Percentiles of the total latency to report
+
+        Returns:
+            - dict: For each "METHOD path", the count, errors, bytes received and sent, retries, new
+              connections and the time spent opening them, latency percentiles and a histogram of total
+              latency in milliseconds
+        '''
+
+        with self._lock:
+            records = list(self.records)
+
+        groups = {}
+        for rec in records:
+            groups.setdefault(rec['method'] + ' ' + rec['path'], []).append(rec)
+
+        out = {}
+        for name, recs in sorted(groups.items()):
+            totals = sorted(r['total'] for r in recs if r['total'] is not None)
+            ttfbs = sorted(r['ttfb'] for r in recs if r['ttfb'] is not None)
+            opened = [r for r in recs if r['connect'] is not None]
+            entry = {
+                'count': len(recs),
+                'errors': sum(1 for r in recs if r['status'] is None or not 200 <= r['status'] < 400),
+                'bytes': sum(r['bytes'] or 0 for r in recs),
+                'bytes_sent': sum(r['bytes_sent'] or 0 for r in recs),
+                'retries': sum(r['retries'] for r in recs),
+                'connections': len(opened),
+                'connect_time': sum(r['dns'] + r['connect'] for r in opened),
+                'total_time': sum(totals),
+                'histogram_ms': self._histogram(totals)
+            }
+            for q in percentiles:
+                entry['total_p%d' % q] = self._percentile(totals, q)
+                entry['ttfb_p%d' % q] = self._percentile(ttfbs, q)
+            out[name] = entry
+        return out
+
+    def export_jsonl(self, file_path):
+        '''
+        Writes every record to a JSON Lines file, one request per line.
+
+        Args:
+            - file_path (str): Location of the file to write
+        '''
+
+        with self._lock:
+            records = list(self.records)
+        with open(file_path, 'w') as f:
+            for rec in records:
+                f.write(json.dumps(rec) + '\n')